@@ -0,0 +1,225 @@
+"""Cached, coalesced arXiv searches for the research server.
+
+Models tend to repeat the same search within a session, so results are kept in a bounded
+in-memory LRU with a TTL and, optionally, in a small SQLite file that survives restarts.
+Identical searches running at the same time share one upstream request, and every request
+goes through a single arXiv client so its delay between calls is respected.
+FakeArxivBackend can stand in for arXiv when working offline or benchmarking.
+"""
+import json
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, Optional, Tuple
+
+import arxiv
+
+
+def normalize_query(topic: str) -> str:
+    """Searches that only differ in case or spacing are the same search."""
+    return " ".join(topic.lower().split())
+
+
+class ArxivBackend:
+    """Live arXiv searches through one shared client.
+
+    arxiv.Client waits `delay_seconds` between its requests, but it isn't thread safe, so
+    requests are serialized here to keep that delay honest across concurrent callers.
+    """
+
+    def __init__(self, delay_seconds: float = 3.0, num_retries: int = 3):
+        self._client = arxiv.Client(delay_seconds=delay_seconds, num_retries=num_retries)
+        self._lock = threading.Lock()
+
+    def search(self, query: str, max_results: int) -> Dict[str, Dict]:
+        """Most relevant papers for `query`, as paper ID -> info."""
+        search = arxiv.Search(
+            query = query,
+            max_results = max_results,
+            sort_by = arxiv.SortCriterion.Relevance
+        )
+        with self._lock:
+            # results() is lazy, the requests happen while we iterate
+            papers = list(self._client.results(search))
+        return {
+            paper.get_short_id(): {
+                'title': paper.title,
+                'authors': [author.name for author in paper.authors],
+                'summary': paper.summary,
+                'pdf_url': paper.pdf_url,
+                'published': str(paper.published.date())
+            }
+            for paper in papers
+        }
+
+
+class SearchCache:
+    """TTL + LRU cache in front of a search backend, with request coalescing.
+
+    `backend` is anything with a `search(query, max_results)` method returning paper ID -> info,
+    so a local fake can stand in for arXiv.
+    """
+
+    def __init__(self, backend, ttl: float = 3600.0, max_entries: int = 256, disk_path: Optional[str] = None):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[float, Dict[str, Dict]]]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, int], Future] = {}
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "expired": 0, "evictions": 0}
+
+        self._disk = None
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute("PRAGMA journal_mode=WAL")
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS searches (query TEXT, max_results INTEGER, fetched REAL, papers TEXT, "
+                "PRIMARY KEY (query, max_results))"
+            )
+            self._disk.commit()
+
+    def search(self, topic: str, max_results: int) -> Dict[str, Dict]:
+        """Papers for (topic, max_results), from the cache when fresh, from the backend otherwise."""
+        key = (normalize_query(topic), max_results)
+        with self._lock:
+            papers = self._lookup(key)
+            if papers is not None:
+                return papers
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                self.counters["misses"] += 1
+                future = self._inflight[key] = Future()
+            else:
+                self.counters["coalesced"] += 1
+        if not leader:
+            # someone is already fetching exactly this, wait for their answer
+            return future.result()
+
+        try:
+            papers = self.backend.search(key[0], max_results)
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            raise
+        try:
+            with self._lock:
+                self._store(key, time.time(), papers)
+                try:
+                    self._save_to_disk(key, papers)
+                except sqlite3.Error as e:
+                    # e.g. locked by another research server sharing the file, the memory tier still has it
+                    print(f"Error saving search {key[0]!r} to disk: {str(e)}", file=sys.stderr)
+        finally:
+            # whatever happens, nobody is left waiting on this search
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_result(papers)
+        return papers
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss/eviction counters plus the current size of the memory tier."""
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self._disk:
+                with self._disk:
+                    self._disk.execute("DELETE FROM searches")
+
+    def _lookup(self, key) -> Optional[Dict[str, Dict]]:
+        # callers hold self._lock
+        entry = self._entries.get(key)
+        if entry is not None:
+            fetched, papers = entry
+            if time.time() - fetched < self.ttl:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return papers
+            del self._entries[key]
+            self.counters["expired"] += 1
+
+        if self._disk:
+            try:
+                row = self._disk.execute(
+                    "SELECT fetched, papers FROM searches WHERE query = ? AND max_results = ?", key
+                ).fetchone()
+            except sqlite3.Error as e:
+                # the disk tier is only a cache, go to the backend instead
+                print(f"Error reading search {key[0]!r} from disk: {str(e)}", file=sys.stderr)
+                row = None
+            if row and time.time() - row[0] < self.ttl:
+                papers = json.loads(row[1])
+                self._store(key, row[0], papers)
+                self.counters["disk_hits"] += 1
+                return papers
+        return None
+
+    def _store(self, key, fetched: float, papers: Dict[str, Dict]) -> None:
+        # callers hold self._lock
+        self._entries[key] = (fetched, papers)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def _save_to_disk(self, key, papers: Dict[str, Dict]) -> None:
+        # callers hold self._lock
+        if not self._disk:
+            return
+        with self._disk:
+            self._disk.execute(
+                "INSERT OR REPLACE INTO searches(query, max_results, fetched, papers) VALUES (?, ?, ?, ?)",
+                (key[0], key[1], time.time(), json.dumps(papers)),
+            )
+
+
+class FakeArxivBackend:
+    """Deterministic, offline stand-in for arXiv with a corpus of `corpus_size` made-up papers.
+
+    Every paper belongs to one of a handful of fields, and a search returns the papers of the
+    fields the query mentions (or all of them), so the same query always gets the same answer.
+    `latency` seconds are slept per search to mimic the network.
+    """
+
+    FIELDS = ["neural networks", "quantum computing", "protein folding", "graph theory",
+              "reinforcement learning", "climate modeling", "computer vision", "cryptography"]
+
+    def __init__(self, corpus_size: int = 1000, latency: float = 0.0):
+        self.corpus_size = corpus_size
+        self.latency = latency
+        self.searches = 0
+
+    def paper(self, index: int) -> Tuple[str, Dict]:
+        """The paper at position `index` of the corpus, as (paper ID, info)."""
+        field = self.FIELDS[index % len(self.FIELDS)]
+        paper_id = f"{2000 + index // 100000:04d}.{index % 100000:05d}v1"
+        return paper_id, {
+            'title': f"On {field}: study {index}",
+            'authors': [f"Author {index % 97}", f"Author {index % 89}"],
+            'summary': f"We study {field} from a new angle. Result {index} improves on earlier work "
+                       f"in {field} with a simple method and careful experiments.",
+            'pdf_url': f"http://arxiv.org/pdf/{paper_id}",
+            'published': f"20{10 + index % 15}-0{1 + index % 9}-1{index % 10}"
+        }
+
+    def search(self, query: str, max_results: int) -> Dict[str, Dict]:
+        if self.latency:
+            time.sleep(self.latency)
+        self.searches += 1
+        fields = [i for i, field in enumerate(self.FIELDS) if field in query] or list(range(len(self.FIELDS)))
+        results = {}
+        for index in range(self.corpus_size):
+            if index % len(self.FIELDS) in fields:
+                paper_id, info = self.paper(index)
+                results[paper_id] = info
+                if len(results) >= max_results:
+                    break
+        return results
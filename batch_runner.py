@@ -0,0 +1,195 @@
+"""Batch mode: answer a JSONL file of queries, many at a time, over one set of MCP sessions.
+
+    uv run batch_runner.py queries.jsonl --output answers.jsonl --concurrency 16
+
+Every input line is a JSON object with an "id" and a "query". Lines shaped like
+requests.jsonl ("request_id", "title", "body") work too, the title and body become the query.
+Each query is its own conversation. Results are appended to the output as soon as they're
+done, one JSON object per line, with the answer, timing and token usage.
+
+Rerunning with the same output resumes: queries that already have an "ok" line are skipped,
+failed ones are tried again (readers should take the last line per id). Queries that hit the
+API's rate limits or overload errors are retried after the Retry-After the API asked for, and
+every other query waits for it too, instead of piling more requests onto the limit.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import anthropic
+
+from mcp_chatbot import MCP_ChatBot
+
+# statuses worth retrying: rate limited, overloaded, or a server error on the API side
+RETRYABLE_STATUS = {429, 500, 502, 503, 504, 529}
+
+
+def load_queries(path: str) -> List[Tuple[str, str]]:
+    """(id, query) of every line of a JSONL file, in order; broken lines are reported and skipped."""
+    queries, seen = [], set()
+    with open(path, "r") as input_file:
+        for number, line in enumerate(input_file, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Skipping line {number} of {path}: {e}", file=sys.stderr)
+                continue
+            query_id = str(item.get("id") or item.get("request_id") or f"line-{number}")
+            query = item.get("query") or "\n\n".join(part for part in (item.get("title"), item.get("body")) if part)
+            if not query:
+                print(f"Skipping line {number} of {path}: no query", file=sys.stderr)
+                continue
+            if query_id in seen:
+                print(f"Skipping line {number} of {path}: id {query_id} already used", file=sys.stderr)
+                continue
+            seen.add(query_id)
+            queries.append((query_id, query))
+    return queries
+
+
+def completed_ids(path: str) -> Set[str]:
+    """Ids that already have a successful result in an earlier run's output."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r") as output_file:
+        for line in output_file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # a line cut short by a crash, that query just runs again
+                continue
+            if record.get("status") == "ok":
+                done.add(str(record.get("id")))
+    return done
+
+
+def retry_delay(error: Exception) -> Optional[float]:
+    """Seconds the API asked us to wait before retrying, None if the error isn't worth a retry."""
+    if isinstance(error, anthropic.APIStatusError):
+        if error.status_code not in RETRYABLE_STATUS:
+            return None
+        try:
+            return float(error.response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            return 0.0
+    if isinstance(error, anthropic.APIConnectionError):
+        return 0.0
+    return None
+
+
+class BatchRunner:
+    BACKOFF_BASE = 1.0  # seconds, doubled on every retry of a query unless the API says how long to wait
+    BACKOFF_MAX = 60.0
+
+    def __init__(self, chatbot: MCP_ChatBot, output_path: str, concurrency: int = 8, max_attempts: int = 5):
+        self.chatbot = chatbot
+        self.output_path = output_path
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.resume_at = 0.0  # monotonic time before which no query starts, set when rate limited
+        self.counts = {"ok": 0, "error": 0, "retries": 0}
+        self._output = None
+
+    async def run(self, queries: List[Tuple[str, str]]) -> Dict[str, int]:
+        done = completed_ids(self.output_path)
+        pending = [(query_id, query) for query_id, query in queries if query_id not in done]
+        print(f"{len(queries)} queries, {len(queries) - len(pending)} already answered, {len(pending)} to run",
+              file=sys.stderr)
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in pending:
+            queue.put_nowait(item)
+        # line buffered, so every finished query is on disk before the next one is written
+        with open(self.output_path, "a", buffering=1) as self._output:
+            workers = [asyncio.create_task(self._worker(queue, len(pending))) for _ in range(self.concurrency)]
+            try:
+                await asyncio.gather(*workers)
+            finally:
+                for worker in workers:
+                    worker.cancel()
+        return self.counts
+
+    async def _worker(self, queue: asyncio.Queue, total: int) -> None:
+        while not queue.empty():
+            query_id, query = queue.get_nowait()
+            record = await self.run_query(query_id, query)
+            self._output.write(json.dumps(record) + "\n")
+            self.counts[record["status"]] += 1
+            finished = self.counts["ok"] + self.counts["error"]
+            line = f"[{finished}/{total}] {query_id} {record['status']} {record['seconds']:.1f}s"
+            if record["status"] == "error":
+                line += f": {record['error']}"
+            print(line, file=sys.stderr)
+
+    async def run_query(self, query_id: str, query: str) -> dict:
+        """Answer one query as a fresh conversation, retrying it while the API is rate limiting us."""
+        usage: Dict[str, int] = {}
+        started = time.time()
+        record = {"id": query_id, "query": query, "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started))}
+        for attempt in range(1, self.max_attempts + 1):
+            await asyncio.sleep(max(0.0, self.resume_at - time.monotonic()))
+            try:
+                answer = await self.chatbot.process_query(query, messages=[], on_text=lambda text: None, usage=usage)
+                record.update(status="ok", answer=answer)
+                break
+            except Exception as e:
+                delay = retry_delay(e)
+                record.update(status="error", error=f"{type(e).__name__}: {e}")
+                if delay is None or attempt == self.max_attempts:
+                    break
+                if not delay:
+                    # no Retry-After, exponential backoff with full jitter
+                    delay = random.uniform(0, min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** (attempt - 1)))
+                # the limit is shared, so everyone holds off, not just this query
+                self.resume_at = max(self.resume_at, time.monotonic() + delay)
+                self.counts["retries"] += 1
+                print(f"{query_id}: {type(e).__name__}, retrying in {delay:.1f}s", file=sys.stderr)
+        record.pop("error" if record["status"] == "ok" else "answer", None)
+        record.update(attempts=attempt, seconds=round(time.time() - started, 3), usage=usage)
+        return record
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of queries with the MCP chatbot, many at a time.")
+    parser.add_argument("input", help="JSONL file, one {\"id\": ..., \"query\": ...} per line")
+    parser.add_argument("--output", help="JSONL results, appended to and resumed from (default: <input>.answers.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=8, help="queries in flight at once")
+    parser.add_argument("--max-model-calls", type=int, default=MCP_ChatBot.MAX_CONCURRENT_MODEL_CALLS,
+                        help="model requests in flight at once, across all queries")
+    parser.add_argument("--attempts", type=int, default=5, help="tries per query when rate limited")
+    parser.add_argument("--config", default="server_config.json")
+    parser.add_argument("--verbose", action="store_true", help="show the chatbot's own output too")
+    args = parser.parse_args()
+
+    queries = load_queries(args.input)
+    output_path = args.output or f"{os.path.splitext(args.input)[0]}.answers.jsonl"
+
+    chatbot = MCP_ChatBot()
+    chatbot.model_limit = asyncio.Semaphore(args.max_model_calls)
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            # the chatbot narrates every hop on stdout, progress and errors go to stderr
+            stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        try:
+            await chatbot.connect_to_servers(args.config)
+            runner = BatchRunner(chatbot, output_path, concurrency=args.concurrency, max_attempts=args.attempts)
+            counts = await runner.run(queries)
+        finally:
+            await chatbot.cleanup()
+    print(f"Done: {counts['ok']} answered, {counts['error']} failed, {counts['retries']} retries. "
+          f"Results in {output_path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
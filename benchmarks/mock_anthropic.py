@@ -0,0 +1,123 @@
+"""Deterministic local stand-in for the Anthropic Messages API.
+
+MockAnthropic has the slice of AsyncAnthropic that MCP_ChatBot uses (`messages.stream(...)`)
+and plays a fixed research conversation, the same one generate_search_prompt asks for:
+
+    1. search arXiv for the query with get_arxiv_papers
+    2. look up every paper it returned with one extract_info_many call
+    3. answer with a short summary
+
+Latency is simulated with a time-to-first-token plus a delay per streamed text chunk, so
+runs are comparable from one machine to the next.
+"""
+import asyncio
+import json
+from types import SimpleNamespace
+from typing import List
+
+
+def _text_of(content) -> str:
+    if isinstance(content, str):
+        return content
+    parts = []
+    for item in content or []:
+        text = item.get("text") if isinstance(item, dict) else getattr(item, "text", None)
+        parts.append(text if text is not None else "")
+    return "\n".join(parts)
+
+
+def _paper_ids(content) -> List[str]:
+    """Paper IDs out of a get_arxiv_papers result, a JSON list or one ID per text block."""
+    text = _text_of(content)
+    try:
+        ids = json.loads(text)
+        if isinstance(ids, list):
+            return [str(paper_id) for paper_id in ids]
+    except json.JSONDecodeError:
+        pass
+    return [line.strip().strip('"') for line in text.splitlines() if line.strip()]
+
+
+class _Stream:
+    def __init__(self, client: "MockAnthropic", blocks: list, input_tokens: int):
+        self._client = client
+        self._blocks = blocks
+        self._input_tokens = input_tokens
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def __aiter__(self):
+        await asyncio.sleep(self._client.ttft)
+        for block in self._blocks:
+            if block.type == "text":
+                for word in block.text.split(" "):
+                    await asyncio.sleep(self._client.chunk_delay)
+                    yield SimpleNamespace(type="text", text=word + " ")
+            yield SimpleNamespace(type="content_block_stop", content_block=block)
+
+    async def get_final_message(self):
+        output_tokens = sum(len(block.text.split()) if block.type == "text" else 20 for block in self._blocks)
+        return SimpleNamespace(
+            content=self._blocks,
+            stop_reason="tool_use" if any(block.type == "tool_use" for block in self._blocks) else "end_turn",
+            usage=SimpleNamespace(input_tokens=self._input_tokens, output_tokens=output_tokens,
+                                  cache_read_input_tokens=0, cache_creation_input_tokens=0),
+        )
+
+
+class _Messages:
+    def __init__(self, client: "MockAnthropic"):
+        self._client = client
+
+    def stream(self, *, messages, tools, **kwargs):
+        self._client.requests += 1
+        input_tokens = len(json.dumps(tools, default=str)) // 4 + len(json.dumps(messages, default=str)) // 4
+        return _Stream(self._client, self._client.next_turn(messages, tools), input_tokens)
+
+
+class MockAnthropic:
+    def __init__(self, fanout: int = 5, ttft: float = 0.05, chunk_delay: float = 0.002):
+        self.fanout = fanout  # papers searched for, and so papers looked up in the second turn
+        self.ttft = ttft
+        self.chunk_delay = chunk_delay
+        self.requests = 0
+        self.messages = _Messages(self)
+        self._ids = 0
+
+    def _tool_use(self, name: str, arguments: dict):
+        self._ids += 1
+        return SimpleNamespace(type="tool_use", id=f"toolu_mock_{self._ids:06d}", name=name, input=arguments)
+
+    def next_turn(self, messages: list, tools: list) -> list:
+        """The assistant blocks of the next turn, decided by what the conversation has seen so far."""
+        last = messages[-1]["content"]
+        if isinstance(last, str) or last[0].get("type") == "text":
+            # a fresh query (the chatbot may have turned it into a text block for caching)
+            query = last if isinstance(last, str) else last[0]["text"]
+            return [
+                SimpleNamespace(type="text", text="Let me search arXiv for that."),
+                self._tool_use("get_arxiv_papers", {"topic": query, "max_results": self.fanout}),
+            ]
+
+        # a tool result came back, find which call it answers
+        calls = {
+            block.id: block.name
+            for message in messages if message["role"] == "assistant"
+            for block in message["content"] if getattr(block, "type", None) == "tool_use"
+        }
+        result = last[0]
+        if calls.get(result["tool_use_id"]) == "get_arxiv_papers":
+            paper_ids = _paper_ids(result["content"])
+            return [
+                SimpleNamespace(type="text", text="Now let me read all of them."),
+                self._tool_use("extract_info_many", {"paper_ids": paper_ids}),
+            ]
+
+        return [SimpleNamespace(
+            type="text",
+            text="Here is a summary of the papers I looked at. " * 5
+        )]
@@ -0,0 +1,247 @@
+"""Replayable benchmarks for the chatbot and the research server, fully offline.
+
+    uv run benchmarks/run.py                      # run every suite, compare with benchmarks/baseline.json
+    uv run benchmarks/run.py --save-baseline      # ... and make this run the new baseline
+    uv run benchmarks/run.py --suites store --sizes 10,1000,100000
+
+Suites:
+    startup  time for MCP_ChatBot.connect_to_servers to bring the research server up
+    query    end-to-end process_query latency, a search + lookup + answer conversation
+    fanout   throughput of concurrent extract_info calls through MCP_ChatBot.call_tool
+    store    extract_info(_many) / get_topic_papers / search_local_papers latency for libraries of 10 to 100k papers
+
+The model is MockAnthropic (benchmarks/mock_anthropic.py) and arXiv is the FakeArxivBackend,
+so the numbers only move when our code does.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# the real client is never called, but it refuses to be built without a key
+os.environ.setdefault("ANTHROPIC_API_KEY", "mock")
+
+from arxiv_cache import FakeArxivBackend  # noqa: E402
+from catalog_cache import CatalogCache  # noqa: E402
+from instrumentation import percentile  # noqa: E402
+from mcp_chatbot import MCP_ChatBot  # noqa: E402
+from mock_anthropic import MockAnthropic  # noqa: E402
+from paper_store import PaperStore  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def research_config(papers_dir: str, corpus_size: int) -> dict:
+    """server_config.json contents for a research server on a fake arXiv and a scratch library."""
+    return {"mcpServers": {"research": {
+        "command": sys.executable,
+        "args": [os.path.join(ROOT, "research_server.py")],
+        "env": {"RESEARCH_PAPERS_DIR": papers_dir, "ARXIV_BACKEND": f"fake:{corpus_size}", "ARXIV_CACHE_DISK": "0"},
+    }}}
+
+
+@contextlib.asynccontextmanager
+async def connected_chatbot(args, workdir: str):
+    """An MCP_ChatBot on MockAnthropic, connected to a research server in `workdir`."""
+    config_path = os.path.join(workdir, "server_config.json")
+    with open(config_path, "w") as config_file:
+        json.dump(research_config(os.path.join(workdir, "papers"), args.corpus), config_file)
+    chatbot = MCP_ChatBot()
+    chatbot.anthropic_client = MockAnthropic(fanout=args.fanout)
+    chatbot.catalog_cache = CatalogCache(os.path.join(workdir, "catalog.json"))
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            await chatbot.connect_to_servers(config_path)
+        if "research" not in chatbot.server_sessions:
+            raise RuntimeError(f"research server didn't start: {chatbot.startup_report.get('research')}")
+        yield chatbot
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            await chatbot.cleanup()
+
+
+def tool_use(name: str, arguments: dict, call_id: str):
+    return SimpleNamespace(type="tool_use", id=call_id, name=name, input=arguments)
+
+
+async def bench_startup(args) -> dict:
+    totals = []
+    phases = {"spawn": [], "initialize": [], "list": []}
+    for _ in range(args.repeats):
+        with tempfile.TemporaryDirectory() as workdir:
+            started = time.perf_counter()
+            async with connected_chatbot(args, workdir) as chatbot:
+                totals.append(time.perf_counter() - started)
+                for phase, values in phases.items():
+                    values.append(chatbot.startup_report["research"][phase])
+    metrics = {"startup.total_seconds": statistics.median(totals)}
+    metrics.update({f"startup.{phase}_seconds": statistics.median(values) for phase, values in phases.items()})
+    return metrics
+
+
+async def bench_query(args) -> dict:
+    fields = FakeArxivBackend.FIELDS
+    latencies = []
+    with tempfile.TemporaryDirectory() as workdir:
+        async with connected_chatbot(args, workdir) as chatbot:
+            for i in range(args.queries):
+                started = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    await chatbot.process_query(fields[i % len(fields)], on_text=lambda text: None)
+                latencies.append(time.perf_counter() - started)
+            model_requests = chatbot.anthropic_client.requests
+    return {
+        "query.p50_seconds": percentile(latencies, 0.50),
+        "query.p95_seconds": percentile(latencies, 0.95),
+        "query.model_requests_per_query": model_requests / args.queries,
+    }
+
+
+async def bench_fanout(args) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        async with connected_chatbot(args, workdir) as chatbot:
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = await chatbot.call_tool(
+                    tool_use("get_arxiv_papers", {"topic": "neural networks", "max_results": args.fanout}, "seed")
+                )
+            if result.get("is_error"):
+                raise RuntimeError(f"seeding the library failed: {result['content']}")
+            paper_ids = [item.text for item in result["content"]]
+            # this suite measures calls that actually reach the server
+            chatbot.tool_cache.configure_server("research", {"extract_info": 0})
+            calls = 0
+            started = time.perf_counter()
+            for round_number in range(args.repeats):
+                batch = [
+                    tool_use("extract_info", {"paper_id": paper_id}, f"call_{round_number}_{i}")
+                    for i, paper_id in enumerate(paper_ids * 4)
+                ]
+                with contextlib.redirect_stdout(io.StringIO()):
+                    await asyncio.gather(*(chatbot.call_tool(block) for block in batch))
+                calls += len(batch)
+            elapsed = time.perf_counter() - started
+    return {"fanout.calls_per_second": calls / elapsed}
+
+
+def _time_calls(fn, arguments: list) -> float:
+    """Average milliseconds per call of fn over `arguments`."""
+    started = time.perf_counter()
+    for argument in arguments:
+        fn(argument)
+    return (time.perf_counter() - started) * 1000 / len(arguments)
+
+
+def bench_store(args) -> dict:
+    import research_server
+
+    metrics = {}
+    rng = random.Random(42)
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            fake = FakeArxivBackend(size)
+            store = PaperStore(os.path.join(workdir, "papers.db"))
+            started = time.perf_counter()
+            for field_index, field in enumerate(fake.FIELDS):
+                papers = dict(fake.paper(i) for i in range(field_index, size, len(fake.FIELDS)))
+                if papers:
+                    store.add_papers(research_server.topic_key(field), papers)
+            metrics[f"store.{size}.build_seconds"] = time.perf_counter() - started
+
+            research_server._store = store
+            try:
+                lookups = [fake.paper(rng.randrange(size))[0] for _ in range(200)]
+                metrics[f"store.{size}.extract_info_ms"] = _time_calls(research_server.extract_info, lookups)
+                metrics[f"store.{size}.extract_info_many_ms"] = _time_calls(
+                    research_server.extract_info_many, [lookups[i:i + 20] for i in range(0, len(lookups), 20)]
+                )
+                metrics[f"store.{size}.get_topic_papers_ms"] = _time_calls(
+                    research_server.get_topic_papers, ["neural_networks", "neural_networks?page=2"] * 25
+                )
+                metrics[f"store.{size}.search_local_papers_ms"] = _time_calls(
+                    research_server.search_local_papers, ["protein folding study", "graph theory method"] * 25
+                )
+            finally:
+                research_server._store = None
+                store.close()
+    return metrics
+
+
+def compare(metrics: dict, baseline: dict, threshold: float) -> bool:
+    """Print every metric next to its baseline, returns True if any got worse by more than `threshold`."""
+    regressed = False
+    print(f"\n{'metric':<40} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, value in metrics.items():
+        before = baseline.get(name)
+        if before is None or before == 0:
+            print(f"{name:<40} {'-':>12} {value:>12.4f}")
+            continue
+        change = (value - before) / before
+        # throughput wants to go up, everything else is a duration and wants to go down
+        worse = -change if name.endswith("_per_second") else change
+        flag = "  REGRESSION" if worse > threshold else ""
+        regressed = regressed or bool(flag)
+        print(f"{name:<40} {before:>12.4f} {value:>12.4f} {change:>+7.0%}{flag}")
+    return regressed
+
+
+async def run(args) -> dict:
+    metrics = {}
+    suites = {"startup": bench_startup, "query": bench_query, "fanout": bench_fanout}
+    for suite in args.suites:
+        print(f"Running {suite}...")
+        if suite == "store":
+            metrics.update(bench_store(args))
+        else:
+            metrics.update(await suites[suite](args))
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the MCP chatbot and research server.")
+    parser.add_argument("--suites", default="startup,query,fanout,store",
+                        type=lambda value: [suite.strip() for suite in value.split(",") if suite.strip()])
+    parser.add_argument("--sizes", default="10,100,1000,10000,100000",
+                        type=lambda value: [int(size) for size in value.split(",")])
+    parser.add_argument("--corpus", type=int, default=1000, help="papers in the fake arXiv")
+    parser.add_argument("--fanout", type=int, default=5, help="papers per search, so lookups per query")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown counted as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--output", help="also write the results as json here")
+    args = parser.parse_args()
+
+    metrics = asyncio.run(run(args))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as baseline_file:
+            baseline = json.load(baseline_file).get("metrics", {})
+    regressed = compare(metrics, baseline, args.threshold)
+
+    result = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "metrics": metrics}
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(result, output_file, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(result, baseline_file, indent=2)
+        print(f"\nSaved as the new baseline: {args.baseline}")
+    if regressed and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
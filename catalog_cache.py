@@ -0,0 +1,72 @@
+"""The tools, prompts and resources each server offered last time, kept between runs.
+
+A catalog is stored with a fingerprint of the server's server_config.json entry and the
+name/version the server reported, and is only reused while the entry is unchanged. That
+lets the chatbot show the model a server's tools before the server has even started (warm
+starts, lazy servers); the live listing replaces the cached one once the server is up.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from typing import Dict, Optional
+
+DEFAULT_PATH = ".mcp_catalog.json"
+
+# server_config.json keys only the chatbot reads, changing them doesn't change what a server offers
+CLIENT_KEYS = {"lazy", "startup_timeout", "max_concurrent_calls", "cache", "pinned_tools"}
+
+
+def fingerprint(server_config: dict) -> str:
+    """Hash of how a server is launched (command, args, env, ...)."""
+    launch = {key: value for key, value in server_config.items() if key not in CLIENT_KEYS}
+    return hashlib.sha256(json.dumps(launch, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class CatalogCache:
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self._catalogs: Optional[Dict[str, dict]] = None
+
+    def _load(self) -> Dict[str, dict]:
+        if self._catalogs is None:
+            try:
+                with open(self.path, "r") as cache_file:
+                    self._catalogs = json.load(cache_file)
+            except (OSError, ValueError):
+                # missing or damaged, every server just gets listed again
+                self._catalogs = {}
+        return self._catalogs
+
+    def get(self, server_name: str, server_fingerprint: str) -> Optional[dict]:
+        """The last catalog of a server, {"tools": [...], "prompts": [...], "resources": [...]}.
+
+        None if there is none, or if it was listed by a server launched differently.
+        """
+        entry = self._load().get(server_name)
+        if not isinstance(entry, dict) or entry.get("fingerprint") != server_fingerprint:
+            return None
+        return entry.get("catalog")
+
+    def version(self, server_name: str) -> Optional[str]:
+        """Name and version the server reported when its cached catalog was listed."""
+        return (self._load().get(server_name) or {}).get("server_version")
+
+    def put(self, server_name: str, server_fingerprint: str, server_version: str, catalog: dict) -> None:
+        catalogs = self._load()
+        entry = {"fingerprint": server_fingerprint, "server_version": server_version, "catalog": catalog}
+        if catalogs.get(server_name) == entry:
+            return
+        catalogs[server_name] = entry
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".mcp_catalog.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as tmp_file:
+                    json.dump(catalogs, tmp_file, indent=2, default=str)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            print(f"Error saving the catalog of {server_name}: {e}")
@@ -0,0 +1,232 @@
+"""Headless multi-user mode: many conversations served over HTTP from one set of MCP sessions.
+
+Run it with `uv run chat_server.py --port 8080`, then:
+
+    POST   /conversations                     -> {"conversation_id": ...}
+    POST   /conversations/<id>/messages       body {"query": ...} -> {"answer": ...}
+           add ?stream=1 to get the answer as newline-delimited JSON events while it's written
+    DELETE /conversations/<id>
+    GET    /health
+    GET    /stats                             -> p50/p95 latencies per tool and server
+
+Every conversation keeps its own message history, but they all share the MCP servers and the
+model client of one MCP_ChatBot. Model requests and tool calls queue up fairly (first come
+first served) behind the chatbot's limits, and requests are turned away with 503 once too many
+queries are already in flight, instead of letting the queues grow without bound.
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from typing import Dict, List
+from urllib.parse import parse_qs, urlsplit
+
+from mcp_chatbot import MCP_ChatBot
+
+MAX_BODY_BYTES = 1_000_000
+
+
+class Conversation:
+    """Message history of one conversation. Queries on it run one at a time."""
+
+    def __init__(self, conversation_id: str):
+        self.id = conversation_id
+        self.messages: List[dict] = []
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ChatServer:
+    def __init__(self, chatbot: MCP_ChatBot, max_active_queries: int = 32, idle_timeout: float = 3600.0):
+        self.chatbot = chatbot
+        self.max_active_queries = max_active_queries
+        self.idle_timeout = idle_timeout  # seconds before an unused conversation is dropped
+        self.conversations: Dict[str, Conversation] = {}
+        self.active_queries = 0
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve a single HTTP/1.1 request, one request per connection."""
+        try:
+            try:
+                method, target, body = await self._read_request(reader)
+                await self.route(method, target, body, writer)
+            except HTTPError as e:
+                await _send_json(writer, e.status, {"error": str(e)})
+            except Exception as e:
+                print(f"Error handling request: {e}")
+                await _send_json(writer, 500, {"error": str(e)})
+        except ConnectionError:
+            pass  # the client went away, nothing left to tell it
+        finally:
+            writer.close()
+
+    async def route(self, method: str, target: str, body: bytes, writer: asyncio.StreamWriter) -> None:
+        url = urlsplit(target)
+        parts = [part for part in url.path.split("/") if part]
+
+        if method == "GET" and parts == ["health"]:
+            await _send_json(writer, 200, {
+                "servers": {name: report["status"] for name, report in self.chatbot.startup_report.items()},
+                "conversations": len(self.conversations),
+                "active_queries": self.active_queries,
+            })
+        elif method == "GET" and parts == ["stats"]:
+            await _send_json(writer, 200, {
+                "latencies": self.chatbot.tracer.stats(),
+                "counters": dict(self.chatbot.tracer.counters),
+            })
+        elif method == "POST" and parts == ["conversations"]:
+            conversation = self._new_conversation()
+            await _send_json(writer, 201, {"conversation_id": conversation.id})
+        elif method == "DELETE" and len(parts) == 2 and parts[0] == "conversations":
+            if self.conversations.pop(parts[1], None) is None:
+                raise HTTPError(404, "Unknown conversation.")
+            await _send_json(writer, 200, {"deleted": parts[1]})
+        elif method == "POST" and len(parts) == 3 and parts[0] == "conversations" and parts[2] == "messages":
+            conversation = self.conversations.get(parts[1])
+            if conversation is None:
+                raise HTTPError(404, "Unknown conversation.")
+            try:
+                query = json.loads(body or b"{}").get("query", "").strip()
+            except (json.JSONDecodeError, AttributeError):
+                raise HTTPError(400, "Body must be a JSON object with a 'query'.")
+            if not query:
+                raise HTTPError(400, "Body must be a JSON object with a 'query'.")
+            stream = parse_qs(url.query).get("stream", ["0"])[0] not in ("0", "false", "")
+            await self.answer(conversation, query, writer, stream)
+        else:
+            raise HTTPError(404, "Not found.")
+
+    async def answer(self, conversation: Conversation, query: str, writer: asyncio.StreamWriter, stream: bool) -> None:
+        """Run one query on a conversation and send the answer back."""
+        if conversation.lock.locked():
+            raise HTTPError(409, "This conversation is still answering its previous query.")
+        if self.active_queries >= self.max_active_queries:
+            raise HTTPError(503, "Too many queries in flight, try again shortly.")
+
+        self.active_queries += 1
+        # a failed query is rolled back, so the history never ends on an unanswered tool_use
+        checkpoint = len(conversation.messages)
+        try:
+            async with conversation.lock:
+                conversation.last_used = time.monotonic()
+                if not stream:
+                    try:
+                        answer = await self.chatbot.process_query(
+                            query, messages=conversation.messages, on_text=lambda text: None
+                        )
+                    except Exception:
+                        del conversation.messages[checkpoint:]
+                        raise
+                    await _send_json(writer, 200, {"conversation_id": conversation.id, "answer": answer})
+                    return
+
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                    b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n"
+                )
+                await writer.drain()
+
+                def send_event(event: dict) -> None:
+                    data = (json.dumps(event) + "\n").encode("utf-8")
+                    writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+                try:
+                    answer = await self.chatbot.process_query(
+                        query, messages=conversation.messages,
+                        on_text=lambda text: send_event({"type": "text", "text": text})
+                    )
+                    send_event({"type": "done", "conversation_id": conversation.id, "answer": answer})
+                except Exception as e:
+                    # the status line is long gone, so the error goes out as the last event
+                    del conversation.messages[checkpoint:]
+                    print(f"Error answering query: {e}")
+                    send_event({"type": "error", "error": str(e)})
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+        finally:
+            self.active_queries -= 1
+            conversation.last_used = time.monotonic()
+
+    def _new_conversation(self) -> Conversation:
+        self._drop_idle_conversations()
+        conversation = Conversation(uuid.uuid4().hex)
+        self.conversations[conversation.id] = conversation
+        return conversation
+
+    def _drop_idle_conversations(self) -> None:
+        cutoff = time.monotonic() - self.idle_timeout
+        for conversation_id, conversation in list(self.conversations.items()):
+            if conversation.last_used < cutoff and not conversation.lock.locked():
+                del self.conversations[conversation_id]
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        request_line = (await reader.readline()).decode("latin-1").strip()
+        try:
+            method, target, _ = request_line.split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line.")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise HTTPError(400, "Bad Content-Length.")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "Request body too large.")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), target, body
+
+
+async def _send_json(writer: asyncio.StreamWriter, status: int, payload: dict) -> None:
+    reasons = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 409: "Conflict",
+               413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+    body = json.dumps(payload).encode("utf-8")
+    headers = [
+        f"HTTP/1.1 {status} {reasons.get(status, '')}",
+        "Content-Type: application/json",
+        f"Content-Length: {len(body)}",
+        "Connection: close",
+    ]
+    if status == 503:
+        headers.append("Retry-After: 1")
+    writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Serve the MCP chatbot to many users over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-active-queries", type=int, default=32)
+    args = parser.parse_args()
+
+    chatbot = MCP_ChatBot()
+    try:
+        await chatbot.connect_to_servers()
+        chat_server = ChatServer(chatbot, max_active_queries=args.max_active_queries)
+        server = await asyncio.start_server(chat_server.handle, args.host, args.port)
+        print(f"\nMCP ChatBot serving on http://{args.host}:{args.port}")
+        async with server:
+            await server.serve_forever()
+    finally:
+        await chatbot.cleanup()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
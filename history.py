@@ -0,0 +1,104 @@
+"""Token-budgeted compaction of the message history of one query.
+
+Every hop of the tool loop resends the whole history, so a large tool result (a fetched web
+page, a file read) gets paid for again on every later model call. Once the history goes over
+its budget, the oldest tool results are swapped for short stubs. Recent turns are never
+touched, and only the content of a tool_result is replaced, so every tool_use keeps its
+matching tool_result.
+"""
+import json
+from typing import List
+
+CHARS_PER_TOKEN = 4  # rough, but good enough to decide when to compact
+STUB_MARKER = "[... older tool result truncated"
+
+
+def _content_chars(content) -> int:
+    """Size in characters of a message content: a string or a list of blocks."""
+    if isinstance(content, str):
+        return len(content)
+    return sum(_block_chars(block) for block in content or [])
+
+
+def _block_chars(block) -> int:
+    get = block.get if isinstance(block, dict) else lambda key, default=None: getattr(block, key, default)
+    block_type = get("type")
+    if block_type == "text":
+        return len(get("text", "") or "")
+    if block_type == "tool_use":
+        return len(get("name", "") or "") + len(json.dumps(get("input", {}), default=str))
+    if block_type == "tool_result":
+        return _content_chars(get("content", ""))
+    return len(str(block))
+
+
+def _content_text(content) -> str:
+    """Plain text of a tool_result content, which may be a string or a list of text blocks."""
+    if isinstance(content, str):
+        return content
+    parts = []
+    for item in content or []:
+        text = item.get("text") if isinstance(item, dict) else getattr(item, "text", None)
+        parts.append(text if text is not None else str(item))
+    return "\n".join(parts)
+
+
+def count_tokens(message: dict) -> int:
+    """Approximate token count of one message."""
+    return _content_chars(message["content"]) // CHARS_PER_TOKEN + 1
+
+
+class HistoryManager:
+    """Keeps a query's message history under a token budget by stubbing out old tool results.
+
+    Compaction runs down to `low_water` of the budget rather than just under it, so the
+    history prefix (and with it the prompt cache) stays stable for several hops afterwards
+    instead of changing on every call.
+    """
+
+    def __init__(self, budget_tokens: int = 50_000, keep_recent: int = 2, stub_chars: int = 500,
+                 low_water: float = 0.75):
+        self.budget_tokens = budget_tokens
+        self.keep_recent = keep_recent  # the newest tool-result messages are always kept whole
+        self.stub_chars = stub_chars  # how much of a compacted result is kept as a preview
+        self.low_water = low_water
+
+    def compact(self, messages: List[dict]) -> int:
+        """Compact `messages` in place if they're over budget, returns the tokens saved."""
+        total = sum(count_tokens(message) for message in messages)
+        if total <= self.budget_tokens:
+            return 0
+
+        target = self.budget_tokens * self.low_water
+        result_messages = [
+            message for message in messages
+            if message["role"] == "user" and not isinstance(message["content"], str)
+            and any(_is_tool_result(block) for block in message["content"])
+        ]
+        candidates = result_messages[:-self.keep_recent] if self.keep_recent else result_messages
+
+        saved = 0
+        for message in candidates:
+            if total - saved <= target:
+                break
+            before = count_tokens(message)
+            message["content"] = [
+                self._stub(block) if _is_tool_result(block) else block for block in message["content"]
+            ]
+            saved += before - count_tokens(message)
+        return saved
+
+    def _stub(self, block: dict) -> dict:
+        text = _content_text(block.get("content", ""))
+        if len(text) <= self.stub_chars or STUB_MARKER in text:
+            return block
+        stub = dict(block)
+        stub["content"] = (
+            f"{text[:self.stub_chars]}\n"
+            f"{STUB_MARKER}, {len(text) - self.stub_chars} more characters omitted ...]"
+        )
+        return stub
+
+
+def _is_tool_result(block) -> bool:
+    return isinstance(block, dict) and block.get("type") == "tool_result"
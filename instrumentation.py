@@ -0,0 +1,156 @@
+"""Spans for every model request, tool call, prompt fetch and resource read.
+
+Each span records its duration plus whatever attributes the caller adds (tokens, payload
+sizes, retries, ...). Finished spans are kept in memory for the `/stats` summary and, if an
+export path is set, appended to a JSONL file. Every line is a complete OTLP/JSON trace export
+request (resourceSpans -> scopeSpans -> spans) holding one span, the format the file receivers
+of OpenTelemetry collectors read.
+"""
+import contextvars
+import json
+import math
+import os
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name: str, attributes: Dict, parent: Optional["Span"]):
+        self.name = name
+        self.attributes = attributes
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+        self._start = time.perf_counter()
+        self.duration = 0.0
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def to_otlp(self) -> Dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of `values`."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+class Tracer:
+    """Collects spans, keeps per-tool and per-server latencies and exports to JSONL."""
+
+    def __init__(self, export_path: Optional[str] = None, window: int = 1000, service_name: str = "mcp-chatbot"):
+        self.export_path = export_path
+        self.service_name = service_name  # the service.name resource attribute of exported spans
+        self.window = window  # latencies kept per key for the percentiles
+        self._latencies: Dict[tuple, Deque[float]] = defaultdict(lambda: deque(maxlen=self.window))
+        self._errors: Dict[tuple, int] = defaultdict(int)
+        self.counters: Dict[str, int] = defaultdict(int)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Time the block as a span, child of whatever span is current. Exceptions mark it as failed."""
+        span = Span(name, attributes, _current_span.get())
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.duration = time.perf_counter() - span._start
+            span.end_ns = span.start_ns + int(span.duration * 1e9)
+            self._finish(span)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """Bump a plain counter (cache hits, retries, ...) shown in the summary."""
+        self.counters[name] += amount
+
+    def _finish(self, span: Span) -> None:
+        failed = span.error is not None or span.attributes.get("error") is True
+        for key in self._keys(span):
+            self._latencies[key].append(span.duration)
+            if failed:
+                self._errors[key] += 1
+        if self.export_path:
+            try:
+                with open(self.export_path, "a") as trace_file:
+                    trace_file.write(json.dumps(self._export_request(span)) + "\n")
+            except OSError as e:
+                print(f"Error exporting span: {e}")
+
+    def _export_request(self, span: Span) -> Dict:
+        """One span wrapped in the resourceSpans/scopeSpans envelope of an OTLP/JSON export."""
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": _otlp_value(self.service_name)}]},
+            "scopeSpans": [{"scope": {"name": __name__}, "spans": [span.to_otlp()]}],
+        }]}
+
+    @staticmethod
+    def _keys(span: Span) -> List[tuple]:
+        # every span counts for its own name, tool calls also per tool, and anything
+        # that talks to a server also per server and operation
+        keys = [("span", span.name)]
+        if "tool" in span.attributes:
+            keys.append(("tool", span.attributes["tool"]))
+        if "server" in span.attributes:
+            keys.append(("server", f"{span.attributes['server']}/{span.name}"))
+        return keys
+
+    def stats(self) -> List[Dict]:
+        """Count, errors, p50 and p95 (in seconds) for every span name, tool and server."""
+        rows = []
+        for (kind, key), latencies in sorted(self._latencies.items()):
+            rows.append({
+                "kind": kind,
+                "name": key,
+                "count": len(latencies),
+                "errors": self._errors[(kind, key)],
+                "p50": percentile(list(latencies), 0.50),
+                "p95": percentile(list(latencies), 0.95),
+            })
+        return rows
+
+    def format_stats(self) -> str:
+        rows = self.stats()
+        if not rows:
+            return "No stats yet."
+        lines = [f"{'':8} {'name':<28} {'count':>6} {'errors':>6} {'p50':>9} {'p95':>9}"]
+        for row in rows:
+            lines.append(
+                f"{row['kind']:<8} {row['name']:<28} {row['count']:>6} {row['errors']:>6} "
+                f"{row['p50'] * 1000:>7.0f}ms {row['p95'] * 1000:>7.0f}ms"
+            )
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name}: {value}")
+        return "\n".join(lines)
@@ -1,161 +1,868 @@
 import os
-from typing import List, TypedDict, Dict 
+from typing import List, TypedDict, Dict, Optional
 import asyncio
 import nest_asyncio ##necessary for different OSs to work properly with python event loops 
 from dotenv import load_dotenv
 from mcp import ClientSession, StdioServerParameters, types 
 from mcp.client.stdio import stdio_client
-from anthropic import Anthropic
+from anthropic import AsyncAnthropic
 from contextlib import AsyncExitStack
+import contextvars
 import json
+import math
+import re
+import random
+import time
+import anyio
+from history import HistoryManager, count_tokens
+from instrumentation import Tracer
+from tool_cache import ToolResultCache, canonical_arguments
+from catalog_cache import CatalogCache, fingerprint
+from tool_router import ToolRouter
+from prefetch_cache import PrefetchCache
 
 nest_asyncio.apply()
 
 load_dotenv()
+
+# paginated resources (like papers://{topic}) point to their next page with this line
+NEXT_PAGE = re.compile(r"^Next page: (\S+)$", re.MULTILINE)
+# resource URIs mentioned in a resource's text, e.g. the topics listed by papers://folders
+RESOURCE_LINK = re.compile(r"[a-z][a-z0-9+.-]*://[^\s()<>\"']+")
+
+# token totals of the query running in the current task, see process_query
+_query_usage: contextvars.ContextVar = contextvars.ContextVar("query_usage", default=None)
+
+# list-changed notifications -> the parts of a server's catalog to list again
+LIST_CHANGED = {
+    types.ToolListChangedNotification: ("tools",),
+    types.PromptListChangedNotification: ("prompts",),
+    types.ResourceListChangedNotification: ("resources", "templates"),
+}
+
+
+def _catalog_entry(kind: str, item):
+    """A listed tool, prompt or resource as plain json, so catalogs can be saved."""
+    if kind == "tools":
+        return {"name": item.name, "description": item.description, "input_schema": item.inputSchema}
+    if kind == "prompts":
+        return {"name": item.name, "description": item.description,
+                "arguments": [arg.model_dump(exclude_none=True) for arg in item.arguments or []]}
+    if kind == "templates":
+        return item.uriTemplate
+    return str(item.uri)
+
+
+def _template_prefix(uri_template: str) -> str:
+    """The fixed part of a resource URI template up to its last '/', e.g. 'papers://' for 'papers://{topic}'."""
+    literal = uri_template.partition("{")[0]
+    return literal[:literal.rfind("/") + 1]
+
+
+def _print_text(text: str) -> None:
+    """Default sink for streamed model text: straight to the terminal."""
+    print(text, end="", flush=True)
+
+
+def _tool_result(tool_use_id: str, content, is_error: bool = False) -> dict:
+    """Build a tool_result block for the next user message."""
+    block = {"type": "tool_result", "tool_use_id": tool_use_id, "content": content}
+    if is_error:
+        block["is_error"] = True
+    return block
+
+
+def _block_field(block, key: str):
+    """A field of a content block, which is a dict when we built it and an SDK object when the model did."""
+    return block.get(key) if isinstance(block, dict) else getattr(block, key, None)
+
+
+def _canonical(value):
+    """Recursively sort dict keys so the same schema always serializes the same way."""
+    if isinstance(value, dict):
+        return {key: _canonical(value[key]) for key in sorted(value)}
+    if isinstance(value, list):
+        return [_canonical(item) for item in value]
+    return value
+
+
+def _with_cache_breakpoint(messages: List[dict]) -> List[dict]:
+    """Copy of `messages` with a cache breakpoint on the very last block.
+
+    The next model call then reads everything up to here from the cache. Only the last
+    message is copied, the stored history itself is left untouched.
+    """
+    if not messages:
+        return messages
+    *prefix, last = messages
+    content = last["content"]
+    content = [{"type": "text", "text": content}] if isinstance(content, str) else list(content)
+    block = content[-1]
+    block = dict(block) if isinstance(block, dict) else block.model_dump(exclude_none=True)
+    block["cache_control"] = {"type": "ephemeral"}
+    content[-1] = block
+    return prefix + [{**last, "content": content}]
+
 # We need to maintain a list of all of the sessions we will be connected to 
 # Also a list of all of the tools and the particular session that tool is related to
 class MCP_ChatBot:
+    # startup knobs -- every server connects in parallel and gets its own budget,
+    # so a slow or dead server never holds up the others
+    STARTUP_TIMEOUT = 30.0  # seconds per attempt for spawn + initialize + listing
+    STARTUP_ATTEMPTS = 3
+    BACKOFF_BASE = 0.5  # seconds, doubled on every retry
+    BACKOFF_MAX = 8.0
+    MODEL = 'claude-3-7-sonnet-20250219'
+    # tool execution knobs
+    MAX_CALLS_PER_SESSION = 4  # default in-flight tool calls per server, "max_concurrent_calls" overrides it
+    TOOL_CALL_TIMEOUT = 120.0  # seconds per tool call
+    PROMPT_CACHING = True  # cache breakpoints on the tool list and the conversation prefix
+    HISTORY_TOKEN_BUDGET = 50_000  # above this, old tool results in a query's history get truncated
+    MAX_CONCURRENT_MODEL_CALLS = 8  # model requests in flight at once, across all conversations
+    MAX_QUEUED_CALLS_PER_SESSION = 32  # tool calls waiting for a busy server before new ones are turned away
+    # health checks -- a server that stops answering pings is reconnected
+    PING_INTERVAL = 15.0  # seconds between pings of an idle server
+    PING_TIMEOUT = 10.0
+    PING_FAILURES = 2  # missed pings in a row before a server is declared dead
+    TOOL_ROUTING_TOP_K = 8  # tools offered per query, picked by relevance (plus pinned ones); 0 offers them all
+    TOOL_ROUTING_CONTEXT = 6  # earlier messages of the conversation whose text counts toward picking them
+    # chat commands -- @ resources and /prompt results are served from cache and refreshed in the background
+    RESOURCE_FRESH_SECONDS = 30.0  # older entries are still shown, but fetched again for next time
+    PREFETCH_RESOURCES = ("papers://folders",)  # fetched as soon as their server connects, with the first links in them
+    PREFETCH_RECENT = 3  # links followed, and resources read most recently fetched again on reconnect or after a write
+
     #Let's initialize session and client objects
     def __init__(self):
-        self.sessions = {}  # dictionary maps tool/prompt names or resource URIs to MCP client sessions
-        self.exit_stack = AsyncExitStack()  # to manage multiple context managers inside the async env
-        self.anthropic_client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))  # initialize the client
-        self.available_tools = [] 
+        self.owners = {}  # tool/prompt names and resource URIs -> name of the server offering them
+        self.template_owners = {}  # fixed prefix of a resource URI template -> name of the server offering it
+        self.anthropic_client = AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))  # initialize the client
+        self.available_tools = []
         self.available_prompts = []  # Prompts list for quick display
-    
-    async def connect_to_a_server(self, server_name: str, server_config: dict) -> None:
-        """Connect to a single server"""
+        self.server_sessions = {}  # server name -> its live session, missing while it's down or not started
+        self.server_configs = {}  # server name -> its server_config.json entry, lazy servers start from it later
+        self.server_tasks = {}  # server name -> the task owning that server's transport
+        self.server_state = {}  # server name -> condition notified whenever its session comes or goes
+        self.health_checks = {}  # server name -> event asking its supervisor to ping right away
+        self.startup_report = {}  # server name -> timings of its connection phase
+        self.call_limits = {}  # server name -> (semaphore bounding its in-flight tool calls, its size)
+        self.call_pending = {}  # server name -> tool calls running or waiting for a slot
+        self.session_calls = {}  # session -> its tool calls in flight, cancelled when the session is dropped
+        self.model_limit = asyncio.Semaphore(self.MAX_CONCURRENT_MODEL_CALLS)
+        self._shutdown = asyncio.Event()  # set on cleanup, releases every server task
+        self.history = HistoryManager(budget_tokens=self.HISTORY_TOKEN_BUDGET)
+        self.session_servers = {}  # session -> name of the server behind it
+        # spans of every model request, tool call, prompt and resource read, exported if MCP_TRACE_FILE is set
+        self.tracer = Tracer(export_path=os.getenv("MCP_TRACE_FILE"))
+        self.tool_cache = ToolResultCache()  # results of read-only tools, see tool_cache.DEFAULT_TTLS
+        self.catalog_cache = CatalogCache()  # last known catalog of every server, for warm starts and lazy ones
+        self.server_catalogs = {}  # server name -> the catalog its tools, prompts and resources come from
+        self._background = set()  # catalog refreshes in flight, referenced so they aren't collected
+        self.tool_router = ToolRouter(top_k=self.TOOL_ROUTING_TOP_K)
+        self.prefetch = PrefetchCache(fresh_seconds=self.RESOURCE_FRESH_SECONDS)
+        self.servers_announcing_updates = set()  # servers that send resources/updated after their writes
+
+    async def connect_to_a_server(self, server_name: str, server_config: dict, ready: asyncio.Future) -> None:
+        """Connect to a single server and keep it connected until cleanup.
+
+        The stdio transport has to be entered and exited by the same task, so each server
+        runs in its own long-lived task with its own exit stack. Once connected, the task
+        supervises the session and reconnects when the transport dies. `ready` is resolved
+        with the first session, or with None after the last failed attempt.
+        """
+        config = dict(server_config)
+        timeout = config.pop("startup_timeout", self.STARTUP_TIMEOUT)
+        max_calls = config.pop("max_concurrent_calls", self.MAX_CALLS_PER_SESSION)
+        if "cache" in config:
+            # per-tool TTL overrides for this server, {"tool_name": seconds}
+            self.tool_cache.configure_server(server_name, config.pop("cache"))
+        self.call_limits.setdefault(server_name, (asyncio.Semaphore(max_calls), max_calls))
+        report = self.startup_report.setdefault(server_name, {"status": "starting", "attempts": 0})
+        report["status"] = "starting"
+        started = time.perf_counter()
+        attempt = 0
         try:
-            server_params = StdioServerParameters(**server_config)
-            stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
-            read, write = stdio_transport
-            session = await self.exit_stack.enter_async_context(ClientSession(read, write))
-            await session.initialize()
+            while attempt < self.STARTUP_ATTEMPTS:
+                attempt += 1
+                report["attempts"] = attempt
+                connected = False
+                try:
+                    # the deadline only covers the handshake, it's lifted once the server is up
+                    with anyio.fail_after(timeout) as scope:
+                        async with AsyncExitStack() as stack:
+                            if attempt > 1:
+                                self.tracer.count("server.connect.retries")
+                            with self.tracer.span("server.connect", server=server_name, attempt=attempt) as span:
+                                session, version, catalog = await self._open_session(stack, server_name, config, report)
+                                span.set(**{phase: report[phase] for phase in ("spawn", "initialize", "list")})
+                            scope.deadline = math.inf
+                            connected = True
+                            await self._attach_session(server_name, session, version, catalog)
+                            report["status"] = "connected"
+                            report.setdefault("total", time.perf_counter() - started)
+                            if not ready.done():
+                                ready.set_result(session)
+                            try:
+                                await self._supervise(server_name, session)
+                            finally:
+                                await self._detach_session(server_name, session)
+                except Exception as e:
+                    if connected:
+                        # a dead transport can fail to close as well, it's replaced all the same
+                        print(f"Error while closing {server_name}: {e}")
+                    else:
+                        error = "timed out" if isinstance(e, TimeoutError) else str(e)
+                        report["error"] = error
+                        print(f"Failed to connect to {server_name} (attempt {attempt}): {error}")
+                if self._shutdown.is_set():
+                    return
+                if connected:
+                    # the session was lost, reconnect with a fresh set of attempts
+                    print(f"Reconnecting to {server_name}...")
+                    self.tracer.count("server.reconnects")
+                    report["status"] = "reconnecting"
+                    report["reconnects"] = report.get("reconnects", 0) + 1
+                    attempt = 0
+                    continue
+                if attempt < self.STARTUP_ATTEMPTS:
+                    # exponential backoff with full jitter so retries don't line up
+                    delay = min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** (attempt - 1))
+                    await asyncio.sleep(random.uniform(0, delay))
+            report["status"] = "failed"
+            report.setdefault("total", time.perf_counter() - started)
+            # cached tools of a server that never came up would only ever fail
+            self._register_catalog(server_name, {"tools": [], "prompts": [], "resources": [], "templates": []})
+            print(f"Failed to connect to {server_name} after {self.STARTUP_ATTEMPTS} attempts. Skipping...")
+        finally:
+            if not ready.done():
+                ready.set_result(None)
+            # let callers waiting for this server find out it's gone
+            async with self.server_state[server_name]:
+                self.server_state[server_name].notify_all()
+
+    async def _open_session(self, stack: AsyncExitStack, server_name: str, server_config: dict, report: dict):
+        """Spawn the server, run the MCP handshake and list what it offers."""
+        t0 = time.perf_counter()
+        server_params = StdioServerParameters(**server_config)
+        read, write = await stack.enter_async_context(stdio_client(server_params))
+        session = await stack.enter_async_context(
+            ClientSession(read, write, message_handler=self._message_handler(server_name))
+        )
+        t1 = time.perf_counter()
+        report["spawn"] = t1 - t0
+
+        init_result = await session.initialize()
+        t2 = time.perf_counter()
+        report["initialize"] = t2 - t1
+        version = f"{init_result.serverInfo.name} {init_result.serverInfo.version}"
+        report["version"] = version
 
-            
+        # only ask for what the server says it has
+        capabilities = init_result.capabilities
+        kinds = ["tools"]
+        if capabilities.prompts:
+            kinds.append("prompts")
+        if capabilities.resources:
+            kinds += ["resources", "templates"]
+        catalog = {"tools": [], "prompts": [], "resources": [], "templates": []}
+        catalog.update(await self._list_catalog(session, kinds))
+        report["list"] = time.perf_counter() - t2
+        return session, version, catalog
+
+    async def _list_catalog(self, session: ClientSession, kinds: List[str]) -> dict:
+        """List the given parts of a server's catalog, all at once. Failed listings are left out."""
+        listings = {
+            "tools": (session.list_tools, "tools"),
+            "prompts": (session.list_prompts, "prompts"),
+            "resources": (session.list_resources, "resources"),
+            "templates": (session.list_resource_templates, "resourceTemplates"),
+        }
+        responses = await asyncio.gather(*(listings[kind][0]() for kind in kinds), return_exceptions=True)
+        catalog = {}
+        for kind, response in zip(kinds, responses):
+            if isinstance(response, Exception):
+                print(f"Error listing {kind}: {response}")
+                continue
+            catalog[kind] = [_catalog_entry(kind, item) for item in getattr(response, listings[kind][1], None) or []]
+        return catalog
+
+    def _message_handler(self, server_name: str):
+        """Handler for what a server sends unprompted.
+
+        List-changed notifications refresh its catalog, resource-updated ones the cached resource.
+        """
+        async def handle(message) -> None:
+            if isinstance(message, types.ServerNotification) and isinstance(message.root, types.ResourceUpdatedNotification):
+                self._resource_updated(server_name, str(message.root.params.uri))
+            elif isinstance(message, types.ServerNotification) and type(message.root) in LIST_CHANGED:
+                # this runs inside the session's receive loop, listing from here would wait on itself
+                task = asyncio.create_task(self._refresh_catalog(server_name, LIST_CHANGED[type(message.root)]))
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+        return handle
+
+    async def _refresh_catalog(self, server_name: str, kinds: tuple) -> None:
+        session = self.server_sessions.get(server_name)
+        if session is None:
+            # not attached yet, the listing that comes with connecting is fresh anyway
+            return
+        listed = await self._list_catalog(session, list(kinds))
+        if not listed:
+            return
+        catalog = {**self.server_catalogs[server_name], **listed}
+        self._register_catalog(server_name, catalog)
+        self.catalog_cache.put(server_name, fingerprint(self.server_configs[server_name]),
+                               self.startup_report[server_name].get("version"), catalog)
+        print(f"[catalog] {server_name} updated its {', '.join(listed)}.")
+
+    def _register_catalog(self, server_name: str, catalog: dict) -> None:
+        """Map the tools, prompts and resources in `catalog` to their server, replacing what it offered before."""
+        self.available_tools = [tool for tool in self.available_tools if self.owners.get(tool["name"]) != server_name]
+        self.available_prompts = [
+            prompt for prompt in self.available_prompts if self.owners.get(prompt["name"]) != server_name
+        ]
+        for name in [name for name, owner in self.owners.items() if owner == server_name]:
+            del self.owners[name]
+        for prefix in [prefix for prefix, owner in self.template_owners.items() if owner == server_name]:
+            del self.template_owners[prefix]
+        for tool in catalog["tools"]:
+            self.owners[tool["name"]] = server_name
+            self.available_tools.append(tool)
+        for prompt in catalog["prompts"]:
+            self.owners[prompt["name"]] = server_name
+            self.available_prompts.append(prompt)
+        for uri in catalog["resources"]:
+            self.owners[uri] = server_name
+        # catalogs cached before templates were listed don't have them
+        for uri_template in catalog.get("templates", []):
+            self.template_owners[_template_prefix(uri_template)] = server_name
+        self.server_catalogs[server_name] = catalog
+
+    async def _attach_session(self, server_name: str, session: ClientSession, version: str, catalog: dict) -> None:
+        """Make a freshly connected session the one every call to its server goes through."""
+        previous = self.server_catalogs.get(server_name)
+        cached_version = self.catalog_cache.version(server_name)
+        if previous is not None and cached_version is not None and cached_version != version:
+            # the model has been shown the catalog of an older build of the server
+            print(f"[catalog] {server_name} is now {version} (was {cached_version}), catalog updated.")
+        elif previous is not None and previous != catalog:
+            # the model has been shown a cached catalog that is out of date by now
+            print(f"[catalog] {server_name} ({version}) changed since its catalog was cached, updated.")
+        self._register_catalog(server_name, catalog)
+        self.catalog_cache.put(server_name, fingerprint(self.server_configs[server_name]), version, catalog)
+        self.server_sessions[server_name] = session
+        self.session_servers[session] = server_name
+        async with self.server_state[server_name]:
+            self.server_state[server_name].notify_all()
+        self.prefetch_server(server_name)
+
+    def prefetch_server(self, server_name: str, uris=()) -> None:
+        """Fetch, in the background, what the chat commands are likely to ask this server for next.
+
+        That's `uris`, the PREFETCH_RESOURCES it serves and the first PREFETCH_RECENT resources
+        of it they link to (papers://folders lists the latest topics first), the pages of it read
+        most recently in this run and its prompts that need no arguments.
+        """
+        if self._shutdown.is_set() or self.prefetch.closed:
+            return
+        for uri in self.PREFETCH_RESOURCES:
+            if self.resource_server(uri) == server_name:
+                self.prefetch.refresh(("resource", uri), lambda uri=uri: self._read_and_follow(server_name, uri))
+        recent = self.prefetch.recent(
+            lambda key: key[0] == "resource" and self.resource_server(key[1]) == server_name, self.PREFETCH_RECENT
+        )
+        for uri in dict.fromkeys([*uris, *(key[1] for key in recent)]):
+            if self.resource_server(uri) == server_name:
+                self.prefetch.refresh(("resource", uri), lambda uri=uri: self.read_resource(uri))
+        for prompt in self.server_catalogs[server_name]["prompts"]:
+            if not any(arg.get("required") for arg in prompt["arguments"]):
+                self.prefetch.refresh(("prompt", prompt["name"], canonical_arguments({})),
+                                      lambda name=prompt["name"]: self._get_prompt(name, {}))
+
+    async def _read_and_follow(self, server_name: str, resource_uri: str) -> Optional[str]:
+        """Read a resource, then prefetch the first PREFETCH_RECENT resources of the same server it links to."""
+        text = await self.read_resource(resource_uri)
+        links = [
+            uri for uri in dict.fromkeys(RESOURCE_LINK.findall(text or ""))
+            if uri != resource_uri and self.resource_server(uri) == server_name
+        ]
+        for uri in links[:self.PREFETCH_RECENT]:
+            self.prefetch.refresh(("resource", uri), lambda uri=uri: self.read_resource(uri))
+        return text
+
+    def _resource_updated(self, server_name: str, resource_uri: str) -> None:
+        """The server says a resource changed: fetch it again, the old copy (and any read in flight) is out of date."""
+        self.servers_announcing_updates.add(server_name)
+        self.prefetch.invalidate(lambda key: key == ("resource", resource_uri))
+        if not (self._shutdown.is_set() or self.prefetch.closed):
+            self.prefetch.refresh(("resource", resource_uri), lambda: self.read_resource(resource_uri))
+
+    def _after_write(self, server_name: str) -> None:
+        """A tool changed this server's data: drop its cached resources and fetch the likely next ones again."""
+        if server_name in self.servers_announcing_updates:
+            # it has already said which of its resources changed, see _resource_updated
+            return
+        dropped = self.prefetch.invalidate(
+            lambda key: key[0] == "resource" and self.resource_server(key[1]) == server_name
+        )
+        self.prefetch_server(server_name, [key[1] for key in dropped[:self.PREFETCH_RECENT]])
+
+    async def _detach_session(self, server_name: str, session: ClientSession) -> None:
+        if self.server_sessions.get(server_name) is session:
+            del self.server_sessions[server_name]
+        self.session_servers.pop(session, None)
+        # calls still waiting on a dead session fail now and get retried, instead of waiting out their timeout
+        for call in self.session_calls.pop(session, ()):
+            call.cancel()
+        async with self.server_state[server_name]:
+            self.server_state[server_name].notify_all()
+
+    async def _supervise(self, server_name: str, session: ClientSession) -> None:
+        """Ping the server every PING_INTERVAL seconds, return on shutdown or once it stops answering.
+
+        A server busy with tool calls isn't pinged on schedule: FastMCP runs sync tools on its
+        event loop, so it can't answer until they are done, and the calls have their own timeout.
+        It takes PING_FAILURES missed pings in a row to give up on a server, or a single one when
+        a failed call asked for the check.
+        """
+        wakeup = self.health_checks[server_name]
+        wakeup.clear()  # a check asked of the previous session
+        failures = 0
+        while True:
+            waiters = [asyncio.ensure_future(self._shutdown.wait()), asyncio.ensure_future(wakeup.wait())]
             try:
-                # List available tools
-                response = await session.list_tools()
-                for tool in response.tools:
-                    self.sessions[tool.name] = session
-                    self.available_tools.append({
-                        "name": tool.name,
-                        "description": tool.description,
-                        "input_schema": tool.inputSchema
-                    })
-            
-                # List available prompts
-                prompts_response = await session.list_prompts()
-                if prompts_response and prompts_response.prompts:
-                    for prompt in prompts_response.prompts:
-                        self.sessions[prompt.name] = session
-                        self.available_prompts.append({
-                            "name": prompt.name,
-                            "description": prompt.description,
-                            "arguments": prompt.arguments
-                        })
-                # List available resources
-                resources_response = await session.list_resources()
-                if resources_response and resources_response.resources:
-                    for resource in resources_response.resources:
-                        resource_uri = str(resource.uri)
-                        self.sessions[resource_uri] = session
-            
-            except Exception as e:
-                print(f"Error {e}")
-      
-        except Exception as e:
-            print(f"Failed to connect to {server_name}: {str(e)}")
+                await asyncio.wait(waiters, timeout=self.PING_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for waiter in waiters:
+                    waiter.cancel()
+            if self._shutdown.is_set():
+                return
+            requested = wakeup.is_set()
+            wakeup.clear()
+            if not requested and self.call_pending.get(server_name, 0) > 0:
+                continue
+            if await self._is_alive(session):
+                failures = 0
+                continue
+            failures += 1
+            if requested or failures >= self.PING_FAILURES:
+                print(f"Lost connection to {server_name}.")
+                return
 
-    async def connect_to_servers(self): 
+    async def _is_alive(self, session: ClientSession) -> bool:
+        try:
+            await asyncio.wait_for(session.send_ping(), timeout=self.PING_TIMEOUT)
+            return True
+        except Exception:
+            return False
+
+    def start_server(self, server_name: str) -> asyncio.Future:
+        """Start the task that connects to (and supervises) a server, resolved like `connect_to_a_server`'s `ready`."""
+        future = asyncio.get_running_loop().create_future()
+        self.server_state.setdefault(server_name, asyncio.Condition())
+        self.health_checks.setdefault(server_name, asyncio.Event())
+        self.server_tasks[server_name] = asyncio.create_task(
+            self.connect_to_a_server(server_name, self.server_configs[server_name], future)
+        )
+        return future
+
+    async def get_session(self, server_name: str, stale: Optional[ClientSession] = None) -> Optional[ClientSession]:
+        """The live session of a server, or None if it can't be had.
+
+        A lazy server is started on first use, and a server that is (re)connecting is waited
+        for. `stale` is a session the caller already knows to be dead.
+        """
+        session = self.server_sessions.get(server_name)
+        if session is not None and session is not stale:
+            return session
+        if server_name not in self.server_configs or self._shutdown.is_set():
+            return None
+        if server_name not in self.server_tasks:
+            print(f"Starting {server_name}...")
+            self.start_server(server_name)
+        task = self.server_tasks[server_name]
+        state = self.server_state[server_name]
+
+        def settled():
+            current = self.server_sessions.get(server_name)
+            return (current is not None and current is not stale) or task.done() \
+                or self.startup_report.get(server_name, {}).get("status") == "failed" or self._shutdown.is_set()
+
+        try:
+            async with state:
+                await asyncio.wait_for(
+                    state.wait_for(settled), timeout=self.STARTUP_TIMEOUT * self.STARTUP_ATTEMPTS
+                )
+        except asyncio.TimeoutError:
+            return None
+        session = self.server_sessions.get(server_name)
+        return session if session is not stale else None
+
+    async def connect_to_servers(self, config_path: str = "server_config.json"):
         """Connect to all MCP servers configured in the server_config.json file"""
         try:
-            with open("server_config.json", "r") as file:
+            with open(config_path, "r") as file:
                 data = json.load(file)
-                #now let's turn our parsed data into a dictionary 
+                #now let's turn our parsed data into a dictionary
                 servers = data.get("mcpServers", {})
         except Exception as e:
             print(f"Error loading server configuration: {str(e)}")
             return # Exit if the config can't be read
+
+        # every server starts at once, we only wait for the ones we know nothing about yet,
+        # until each of them is either up or has given up
+        ready = []
+        warm = {}  # server name -> resolved once it is up or has given up
         for server_name, server_config in servers.items():
-            for attempt in range(3): #try up to 3 times 
-                try:
-                    await self.connect_to_a_server(server_name, server_config)
-                    break #if successful, move to the next one 
-                except Exception as e:
-                    print(f"Failed to connect to {server_name} (attempt {attempt + 1}): {str(e)}")
-                    await asyncio.sleep(1) #wait for 1 second before retrying
-            else:
-                print(f"Failed to connect to {server_name} after 3 attempts. Skipping...")
+            config = dict(server_config)
+            lazy = config.pop("lazy", False)
+            self.tool_router.pinned.update(config.pop("pinned_tools", []))
+            self.server_configs[server_name] = config
+            catalog = self.catalog_cache.get(server_name, fingerprint(config))
+            if catalog is None:
+                ready.append(self.start_server(server_name))
+                continue
+            # the model sees last run's catalog right away, the live one replaces it once the server is up
+            self._register_catalog(server_name, catalog)
+            if lazy:
+                # not spawned until one of its tools is used
+                self.startup_report[server_name] = {"status": "lazy", "attempts": 0}
+                continue
+            warm[server_name] = self.start_server(server_name)
+        if ready:
+            await asyncio.wait(ready)
+        self.print_startup_report([name for name in self.startup_report if name not in warm])
+        if warm:
+            print(f"Starting in the background, cached catalogs in use meanwhile: {', '.join(warm)}")
+            task = asyncio.create_task(self._report_warm_start(warm))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    async def _report_warm_start(self, warm: Dict[str, asyncio.Future]) -> None:
+        """Print the startup report of the servers started in the background, once they have settled."""
+        await asyncio.wait(warm.values())
+        self.print_startup_report(list(warm))
+
+    def print_startup_report(self, server_names: Optional[List[str]] = None):
+        """Print how long each server (all of them by default) took to spawn, initialize and list its catalog."""
+        if server_names is None:
+            server_names = list(self.startup_report)
+        if not server_names:
+            return
+        print("\nServer startup:")
+        for server_name in server_names:
+            report = self.startup_report[server_name]
+            timings = "  ".join(
+                f"{phase} {report[phase]:.2f}s" for phase in ("spawn", "initialize", "list", "total") if phase in report
+            )
+            line = f"  {server_name:<12} {report['status']:<10} {timings}  (attempts: {report['attempts']})"
+            if report["status"] != "connected" and report.get("error"):
+                line += f"  last error: {report['error']}"
+            print(line)
         
-    async def process_query(self, query):
-        messages = [{'role':'user', 'content':query}]
+    async def process_query(self, query, messages: Optional[List[dict]] = None, on_text=None,
+                            usage: Optional[dict] = None) -> str:
+        """Answer `query` with as many model/tool hops as it takes and return the final answer.
+
+        `messages` is the conversation so far and is extended in place, so a caller can keep
+        one per conversation; by default every query starts a fresh one. Text is handed to
+        `on_text` as it streams in, and printed when no callback is given. The number of model
+        requests and their token counts are added up in `usage`, if given.
+        """
+        token = _query_usage.set({} if usage is None else usage)
+        try:
+            with self.tracer.span("query") as span:
+                try:
+                    return await self._run_query(query, [] if messages is None else messages, on_text or _print_text)
+                finally:
+                    span.set(**_query_usage.get())
+        finally:
+            _query_usage.reset(token)
+
+    async def _run_query(self, query, messages: List[dict], on_text) -> str:
+        messages.append({'role':'user', 'content':query})
+        # the tools relevant to this query are picked once and serialized once, so every hop
+        # sends the same payload and keeps hitting the prompt cache
+        offered = self.route_tools(query, messages)
+        tools = self.cached_tools(offered)
         
         while True:
-            response = self.anthropic_client.messages.create(
-                max_tokens = 2024,
-                model = 'claude-3-7-sonnet-20250219', 
-                tools = self.available_tools,
-                messages = messages
-            )
-            
-            assistant_content = []
-            has_tool_use = False
-            
-            for content in response.content:
-                if content.type == 'text':
-                    print(content.text)
-                    assistant_content.append(content)
-                elif content.type == 'tool_use':
-                    has_tool_use = True
-                    assistant_content.append(content)
-                    messages.append({'role':'assistant', 'content':assistant_content})
-                    
-                    # now let's get the session and call the tool needed
-                    session = self.sessions.get(content.name)
-                    if not session:
-                        print(f"Tool '{content.name}' not found.") 
-                        break
-                        
-                    result = await session.call_tool(content.name, arguments=content.input)
-                    messages.append({
-                        "role": "user", 
-                        "content": [
-                            {
-                                "type": "tool_result",
-                                "tool_use_id": content.id,
-                                "content": result.content
-                            }
-                        ]
-                    })
+            # keep old, large tool results from being resent in full on every hop
+            saved = self.history.compact(messages)
+            if saved:
+                print(f"[history] truncated old tool results, ~{saved} tokens saved")
+
+            # tool calls start as soon as their input is complete, while the model is still talking
+            tool_calls = []
+            try:
+                # model requests from every conversation queue up here, first come first served
+                async with self.model_limit:
+                    response = await self._stream_turn(tools, messages, on_text, tool_calls)
+            except BaseException:
+                # don't leave calls running for a turn we'll never answer
+                for task in tool_calls:
+                    task.cancel()
+                raise
+
+            # the whole turn goes back as one assistant message ...
+            messages.append({'role':'assistant', 'content':response.content})
             # Exit loop if no tool was used
-            if not has_tool_use:
-                break
+            if not tool_calls:
+                return "".join(block.text for block in response.content if block.type == 'text')
 
-    async def get_resource(self, resource_uri: str) -> str:
-        session = self.sessions.get(resource_uri)
-        # if not found, but it's a papers URI, use any available papers session as a fallback
-        if not session and resource_uri.startswith("papers://"):
-            for uri, sess in self.sessions.items():
-                if uri.startswith("papers://"):
-                    session = sess
-                    break
+            # ... and all of its tool results as one user message, in tool_use order
+            tool_results = await asyncio.gather(*tool_calls)
+            messages.append({'role':'user', 'content':list(tool_results)})
+
+            requested = {block.name for block in response.content if block.type == 'tool_use'}
+            if offered is not None and not requested <= offered:
+                # the model went looking for a tool it wasn't offered, show it everything from here on
+                print(f"[tools] {', '.join(sorted(requested - offered))} not offered, sending all tools")
+                self.tracer.count("tool_router.widened")
+                offered = None
+                tools = self.cached_tools()
+
+    async def _stream_turn(self, tools: List[dict], messages: List[dict], on_text, tool_calls: list):
+        """One streamed model request. Tool calls are started (and added to `tool_calls`) as they complete."""
+        with self.tracer.span("model.request", model=self.MODEL, messages=len(messages),
+                              history_tokens=sum(count_tokens(message) for message in messages)) as span:
+            async with self.anthropic_client.messages.stream(
+                max_tokens = 2024,
+                model = self.MODEL, 
+                tools = tools,
+                messages = _with_cache_breakpoint(messages) if self.PROMPT_CACHING else messages
+            ) as stream:
+                async for event in stream:
+                    if event.type == 'text':
+                        on_text(event.text)
+                    elif event.type == 'content_block_stop':
+                        if event.content_block.type == 'text':
+                            on_text("\n")
+                        elif event.content_block.type == 'tool_use':
+                            tool_calls.append(asyncio.create_task(self.call_tool(event.content_block)))
+                response = await stream.get_final_message()
+            self.report_usage(response.usage, span)
+            span.set(tool_calls=len(tool_calls), stop_reason=str(response.stop_reason))
+        return response
+
+    def route_tools(self, query, messages: List[dict]) -> Optional[set]:
+        """Names of the tools to offer the model for `query` in this conversation, None to offer all of them."""
+        # tools the conversation has already used stay on offer
+        used = {
+            _block_field(block, "name")
+            for message in messages if message["role"] == "assistant" and not isinstance(message["content"], str)
+            for block in message["content"] if _block_field(block, "type") == "tool_use"
+        }
+        # "now save that" is about whatever the last few messages were about, so their text counts too
+        text = [query if isinstance(query, str) else str(query)]
+        for message in messages[:-1][-self.TOOL_ROUTING_CONTEXT:]:
+            if isinstance(message["content"], str):
+                text.append(message["content"])
+            else:
+                text.extend(_block_field(block, "text") or "" for block in message["content"]
+                            if _block_field(block, "type") == "text")
+        offered = self.tool_router.select(self.available_tools, "\n".join(text), used, servers=self.owners)
+        if offered is not None:
+            print(f"[tools] offering {len(offered)} of {len(self.available_tools)} tools")
+        return offered
+
+    def cached_tools(self, names: Optional[set] = None) -> List[dict]:
+        """The tool list as it's sent to the model, only the tools in `names` if given.
+
+        Tools are sorted by name and their schemas by key, so the payload (and with it the
+        prompt-cache key) is the same whichever server happened to connect first.
+        """
+        tools = [
+            _canonical(tool) for tool in sorted(self.available_tools, key=lambda tool: tool["name"])
+            if names is None or tool["name"] in names
+        ]
+        if tools and self.PROMPT_CACHING:
+            tools[-1]["cache_control"] = {"type": "ephemeral"}
+        return tools
+
+    def report_usage(self, usage, span=None) -> None:
+        """Print the token usage of one model call, split by how it hit the prompt cache."""
+        cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+        cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+        tokens = {"input_tokens": usage.input_tokens, "output_tokens": usage.output_tokens,
+                  "cache_read_tokens": cache_read, "cache_write_tokens": cache_write}
+        for name, value in tokens.items():
+            self.tracer.count(name, value)
+        if span is not None:
+            span.set(**tokens)
+        totals = _query_usage.get()
+        if totals is not None:
+            totals["model_requests"] = totals.get("model_requests", 0) + 1
+            for name, value in tokens.items():
+                totals[name] = totals.get(name, 0) + value
+        print(f"[tokens] cache read: {cache_read}, cache write: {cache_write}, "
+              f"uncached: {usage.input_tokens}, output: {usage.output_tokens}")
+
+    async def call_tool(self, tool_use) -> dict:
+        """Call the tool behind a single tool_use block and wrap the outcome as a tool_result.
 
+        Calls to different servers run side by side, calls to the same server are bounded
+        by its concurrency limit. A call that fails because its server died is run again,
+        once, as soon as the server has been reconnected.
+        """
+        # now let's find the server and call the tool needed
+        server_name = self.owners.get(tool_use.name)
+        with self.tracer.span("tool.call", tool=tool_use.name, server=server_name or "unknown",
+                              args_bytes=len(json.dumps(tool_use.input, default=str))) as span:
+            if not server_name:
+                print(f"Tool '{tool_use.name}' not found.")
+                span.set(error=True, outcome="not_found")
+                return _tool_result(tool_use.id, f"Tool '{tool_use.name}' not found.", is_error=True)
+
+            cached = self.tool_cache.get(server_name, tool_use.name, tool_use.input)
+            if cached is not None:
+                self.tracer.count("tool_cache.hits")
+                span.set(cache_hit=True, outcome="ok")
+                return _tool_result(tool_use.id, cached)
+
+            # starts a lazy server, or waits for one that is reconnecting
+            session = await self.get_session(server_name)
+            if session is None:
+                print(f"Tool '{tool_use.name}' unavailable, {server_name} is not connected.")
+                span.set(error=True, outcome="unavailable")
+                return _tool_result(tool_use.id, f"The server providing '{tool_use.name}' is not available.", is_error=True)
+
+            # backpressure: once a server's queue is full, turn the call away instead of piling on
+            limit, capacity = self.call_limits[server_name]
+            if self.call_pending.get(server_name, 0) >= capacity + self.MAX_QUEUED_CALLS_PER_SESSION:
+                print(f"Tool '{tool_use.name}' rejected, its server is overloaded.")
+                span.set(error=True, outcome="rejected")
+                return _tool_result(tool_use.id, "The server is busy, try this tool again later.", is_error=True)
+
+            self.call_pending[server_name] = self.call_pending.get(server_name, 0) + 1
+            queued = time.perf_counter()
+            try:
+                async with limit:
+                    span.set(queue_seconds=time.perf_counter() - queued)
+                    try:
+                        result = await self._call_session(session, tool_use)
+                    except asyncio.TimeoutError:
+                        raise
+                    except Exception:
+                        # tool errors come back as results, so this is the transport; retry if the server died
+                        session = await self._reconnected(server_name, session)
+                        if session is None:
+                            raise
+                        print(f"Retrying '{tool_use.name}' on the new {server_name} session.")
+                        self.tracer.count("tool.call.retries")
+                        span.set(retried=True)
+                        result = await self._call_session(session, tool_use)
+            except asyncio.TimeoutError:
+                print(f"Tool '{tool_use.name}' timed out after {self.TOOL_CALL_TIMEOUT:.0f}s.")
+                span.set(error=True, outcome="timeout")
+                return _tool_result(tool_use.id, f"Tool call timed out after {self.TOOL_CALL_TIMEOUT:.0f} seconds.", is_error=True)
+            except Exception as e:
+                print(f"Error calling tool '{tool_use.name}': {e}")
+                span.set(error=True, outcome="error")
+                return _tool_result(tool_use.id, f"Error: {e}", is_error=True)
+            finally:
+                self.call_pending[server_name] -= 1
+                # a write may have gone through even if the call failed on our side
+                self.tool_cache.after_call(server_name, tool_use.name)
+                if tool_use.name in self.tool_cache.invalidators:
+                    self._after_write(server_name)
+
+            is_error = bool(getattr(result, "isError", False))
+            if not is_error:
+                self.tool_cache.put(server_name, tool_use.name, tool_use.input, result.content)
+            span.set(error=is_error, outcome="error" if is_error else "ok",
+                     result_bytes=sum(len(getattr(item, "text", "") or "") for item in result.content))
+            return _tool_result(tool_use.id, result.content, is_error=is_error)
+
+    async def _call_session(self, session: ClientSession, tool_use):
+        # its own task, so dropping the session (see _detach_session) can fail it right away
+        call = asyncio.ensure_future(session.call_tool(tool_use.name, arguments=tool_use.input))
+        calls = self.session_calls.setdefault(session, set())
+        calls.add(call)
+        try:
+            # the timeout starts once we have a slot, waiting in line doesn't count
+            done, _ = await asyncio.wait([call], timeout=self.TOOL_CALL_TIMEOUT)
+        finally:
+            calls.discard(call)
+            if not calls and self.session_calls.get(session) is calls:
+                del self.session_calls[session]
+            if not call.done():
+                call.cancel()
+        if not done:
+            raise asyncio.TimeoutError
+        if call.cancelled():
+            raise ConnectionError("the session was closed while the tool was running")
+        return call.result()
+
+    async def _reconnected(self, server_name: str, session: ClientSession) -> Optional[ClientSession]:
+        """After a failed call: the server's new session if `session` turned out to be dead, else None."""
+        if session in self.session_servers:
+            if await self._is_alive(session):
+                return None
+            # no need to wait for the next scheduled ping
+            self.health_checks[server_name].set()
+        return await self.get_session(server_name, stale=session)
+
+    def resource_server(self, resource_uri: str) -> Optional[str]:
+        """Name of the server offering a resource, by its exact URI or else the longest matching URI template."""
+        server_name = self.owners.get(resource_uri)
+        path = resource_uri.partition("?")[0]
+        end = path.rfind("/")
+        # one lookup per '/' in the URI, however many resources there are
+        while server_name is None and end >= 0:
+            server_name = self.template_owners.get(path[:end + 1])
+            end = path.rfind("/", 0, end)
+        return server_name
+
+    async def read_resource(self, resource_uri: str) -> Optional[str]:
+        """Read a resource and return its text, or None if there's nothing to read."""
+        server_name = self.resource_server(resource_uri)
+        session = await self.get_session(server_name) if server_name else None
         if not session:
             print(f"Resource {resource_uri} not found.")
-            return
-        
-        try:
+            return None
+
+        with self.tracer.span("resource.read", uri=resource_uri, server=server_name) as span:
             result = await session.read_resource(uri = resource_uri)
-            if result and result.contents:
-                print(f"\nResource: {resource_uri}")
-                print("Content:")
-                print(result.contents[0].text) #for now let's just simply print the content of the resource
-            else:
+            text = result.contents[0].text if result and result.contents else None
+            span.set(result_bytes=len(text or ""))
+        return text
+
+    async def iter_resource_pages(self, resource_uri: str):
+        """Yield a resource page by page.
+
+        Paginated resources end a page with a 'Next page: <uri>' line, the next page is only
+        fetched once the caller asks the generator for it.
+        """
+        while resource_uri:
+            # served from the prefetch cache, stale pages are refreshed behind the scenes
+            text = await self.prefetch.get(
+                ("resource", resource_uri), lambda uri=resource_uri: self.read_resource(uri)
+            )
+            if text is None:
+                return
+            yield text
+            next_page = NEXT_PAGE.search(text)
+            resource_uri = next_page.group(1) if next_page else None
+
+    async def get_resource(self, resource_uri: str) -> str:
+        pages = self.iter_resource_pages(resource_uri)
+        try:
+            shown = False
+            async for text in pages:
+                if not shown:
+                    print(f"\nResource: {resource_uri}")
+                    print("Content:")
+                    shown = True
+                print(text)
+                if NEXT_PAGE.search(text) and input("Press Enter for the next page, or type q to stop: ").strip():
+                    break
+            if not shown:
                 print("No content available.")
         except Exception as e:
             print(f"Error: {e}")
             return f"Error: {e}"
+        finally:
+            await pages.aclose()
 
     async def list_prompts(self):
             """List all available prompts."""
@@ -171,16 +878,27 @@ class MCP_ChatBot:
                         arg_name = arg.name if hasattr(arg, "name") else arg.get("name", "")
                         print (f"    - {arg_name}")
 
+    async def _get_prompt(self, prompt_name: str, args: dict):
+        server_name = self.owners.get(prompt_name)
+        session = await self.get_session(server_name) if server_name else None
+        if not session:
+            print(f"Prompt '{prompt_name}' unavailable, its server is not connected.")
+            return None
+        with self.tracer.span("prompt.get", prompt=prompt_name, server=server_name):
+            return await session.get_prompt(prompt_name, arguments=args)
+
     async def execute_prompt(self, prompt_name, args):
         """Execute a prompt with the given arguments."""
-        # first let's check if we have a connection for this prompt
-        session = self.sessions.get(prompt_name)
-        if not session:
+        # first let's check if some server offers this prompt
+        if prompt_name not in self.owners:
             print(f"Prompt '{prompt_name}' not found.")
             return
         
         try:
-            result = await session.get_prompt(prompt_name, arguments=args)
+            # prompts without arguments are usually prefetched already
+            result = await self.prefetch.get(
+                ("prompt", prompt_name, canonical_arguments(args)), lambda: self._get_prompt(prompt_name, args)
+            )
             if result and result.messages:
                 prompt_content = result.messages[0].content
                 
@@ -207,6 +925,7 @@ class MCP_ChatBot:
         print("Use @<topic> to search for papers on a specific topic")
         print("Use /prompts to list available prompts")
         print("Use /prompt <prompt_name> <arg1=value1> to execute a prompt")
+        print("Use /stats to see latencies per tool and server")
         print("\nType 'exit' to end the chat.")
 
         # now keep chatting until the user types 'exit'.
@@ -234,6 +953,8 @@ class MCP_ChatBot:
                     command = parts[0].lower()
                     if command == "/prompts":
                         await self.list_prompts()
+                    elif command == "/stats":
+                        print(self.tracer.format_stats())
                     elif command == "/prompt":
                         if len(parts) < 2:
                             print("Usage: /prompt <prompt_name> <arg1=value1>...")
@@ -260,7 +981,16 @@ class MCP_ChatBot:
         
 
     async def cleanup(self):
-        await self.exit_stack.aclose()
+        # catalog refreshes still running would list from sessions about to close
+        for task in self._background:
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        # a session closed while its server is still answering a prefetch doesn't close cleanly
+        await self.prefetch.close()
+        # release every server task so each one closes the transport it opened
+        self._shutdown.set()
+        if self.server_tasks:
+            await asyncio.gather(*self.server_tasks.values(), return_exceptions=True)
         print("\nMCP ChatBot Stopped!")
       
 
@@ -268,7 +998,7 @@ async def main():
     chatbot = MCP_ChatBot() 
     # as we need our sessions to stay open and accessible beyond a single block for our assistant 
     # we cannot use the "with" or "async with" statements 
-    # so we need to manually close all resources managed by the exit stack
+    # so we need to manually close all the server connections on the way out
     try: 
         await chatbot.connect_to_servers()
         await chatbot.chat_loop()
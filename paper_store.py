@@ -0,0 +1,329 @@
+"""SQLite storage for the papers the research server has fetched.
+
+Papers live in one table keyed by their arXiv short ID, and a join table maps topics to
+papers, so looking a paper up or listing a topic is an index hit no matter how big the
+library grows. Titles, authors and summaries are also kept in a BM25 index (see search_index).
+The per-topic papers_info.json files from older versions are imported once, and are still
+kept up to date as a readable copy through TopicJournal.
+"""
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import search_index
+
+try:
+    import fcntl
+except ImportError:  # no fcntl on Windows, writers there are only serialized within one process
+    fcntl = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS papers (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    authors TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    pdf_url TEXT,
+    published TEXT
+);
+CREATE TABLE IF NOT EXISTS topics (
+    name TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS topic_papers (
+    topic TEXT NOT NULL REFERENCES topics(name),
+    paper_id TEXT NOT NULL REFERENCES papers(id),
+    PRIMARY KEY (topic, paper_id)
+);
+-- rowids are implicitly part of every index, so this one also keeps insertion order per topic
+CREATE INDEX IF NOT EXISTS topic_papers_by_topic ON topic_papers(topic);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+PAPER_COLUMNS = "id, title, authors, summary, pdf_url, published"
+
+
+def _row_to_paper(row) -> Dict:
+    """Turn a papers row back into the dict shape the tools have always returned."""
+    return {
+        "title": row[1],
+        "authors": json.loads(row[2]),
+        "summary": row[3],
+        "pdf_url": row[4],
+        "published": row[5],
+    }
+
+
+class PaperStore:
+    """Indexed paper library backed by a single SQLite database in WAL mode."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        # one connection shared by every caller, the lock keeps transactions from interleaving
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        search_index.create(self._conn)
+        self._conn.commit()
+        self._index_missing()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def add_papers(self, topic: str, papers: Dict[str, Dict]) -> List[str]:
+        """Insert or update `papers` (paper ID -> info) and file them under `topic`, in one transaction.
+
+        Returns the IDs that weren't filed under `topic` before.
+        """
+        with self._lock, self._conn:
+            filed = {
+                row[0] for row in self._conn.execute(
+                    f"SELECT paper_id FROM topic_papers WHERE topic = ? AND paper_id IN ({', '.join('?' * len(papers))})",
+                    (topic, *papers),
+                )
+            } if papers else set()
+            self._conn.execute("INSERT OR IGNORE INTO topics(name) VALUES (?)", (topic,))
+            self._conn.executemany(
+                f"INSERT INTO papers({PAPER_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET title=excluded.title, authors=excluded.authors, "
+                "summary=excluded.summary, pdf_url=excluded.pdf_url, published=excluded.published",
+                [
+                    (paper_id, info["title"], json.dumps(info["authors"]), info["summary"],
+                     info.get("pdf_url"), info.get("published"))
+                    for paper_id, info in papers.items()
+                ],
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO topic_papers(topic, paper_id) VALUES (?, ?)",
+                [(topic, paper_id) for paper_id in papers],
+            )
+            for paper_id, info in papers.items():
+                search_index.index_paper(self._conn, paper_id, info)
+        return [paper_id for paper_id in papers if paper_id not in filed]
+
+    def get_paper(self, paper_id: str) -> Optional[Dict]:
+        """Look a paper up by its arXiv short ID."""
+        with self._lock:
+            row = self._conn.execute(f"SELECT {PAPER_COLUMNS} FROM papers WHERE id = ?", (paper_id,)).fetchone()
+        return _row_to_paper(row) if row else None
+
+    def get_papers(self, paper_ids: List[str]) -> Dict[str, Dict]:
+        """Look several papers up at once, IDs that aren't stored are left out."""
+        if not paper_ids:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {PAPER_COLUMNS} FROM papers WHERE id IN ({', '.join('?' * len(paper_ids))})",
+                list(paper_ids),
+            ).fetchall()
+        return {row[0]: _row_to_paper(row) for row in rows}
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[str, float, Dict]]:
+        """Best matching papers for a free-text query as (paper ID, BM25 score, info), best first."""
+        with self._lock:
+            ranked = search_index.search(self._conn, query, limit)
+        papers = self.get_papers([paper_id for paper_id, _ in ranked])
+        return [(paper_id, score, papers[paper_id]) for paper_id, score in ranked if paper_id in papers]
+
+    def get_topic_papers(self, topic: str, offset: int = 0, limit: Optional[int] = None) -> Dict[str, Dict]:
+        """Papers filed under `topic` in the order they were added, optionally just one slice of them."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join('p.' + column for column in PAPER_COLUMNS.split(', '))} "
+                "FROM topic_papers tp JOIN papers p ON p.id = tp.paper_id "
+                "WHERE tp.topic = ? ORDER BY tp.rowid LIMIT ? OFFSET ?",
+                (topic, -1 if limit is None else limit, offset),
+            ).fetchall()
+        return {row[0]: _row_to_paper(row) for row in rows}
+
+    def count_topic_papers(self, topic: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM topic_papers WHERE topic = ?", (topic,)).fetchone()[0]
+
+    def list_topics(self, recent_first: bool = False) -> List[str]:
+        """Names of all topics that have at least one paper, by name or with the latest to get new papers first."""
+        with self._lock:
+            if recent_first:
+                # rowids grow with every paper filed, and the per-topic index already has them
+                rows = self._conn.execute(
+                    "SELECT topic FROM topic_papers GROUP BY topic ORDER BY MAX(rowid) DESC"
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT name FROM topics WHERE EXISTS (SELECT 1 FROM topic_papers WHERE topic = name) ORDER BY name"
+                ).fetchall()
+        return [row[0] for row in rows]
+
+    def _index_missing(self) -> None:
+        # papers saved before the search index existed get indexed once
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                f"SELECT {PAPER_COLUMNS} FROM papers WHERE id NOT IN (SELECT paper_id FROM index_docs)"
+            ).fetchall()
+            for row in rows:
+                search_index.index_paper(self._conn, row[0], _row_to_paper(row))
+
+    def migrate_json_dir(self, papers_dir: str) -> int:
+        """Import the `<topic>/papers_info.json` files of older versions, once.
+
+        Returns the number of papers imported (0 when the migration already ran).
+        """
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                return 0
+            imported = 0
+            if os.path.isdir(papers_dir):
+                for topic in sorted(os.listdir(papers_dir)):
+                    topic_dir = os.path.join(papers_dir, topic)
+                    file_path = os.path.join(topic_dir, TopicJournal.JSON_NAME)
+                    if not os.path.isfile(file_path):
+                        continue
+                    try:
+                        papers_info = TopicJournal().read(topic_dir)
+                    except (OSError, json.JSONDecodeError) as e:
+                        print(f"Skipping {file_path} during migration: {str(e)}", file=sys.stderr)
+                        continue
+                    self.add_papers(topic, papers_info)
+                    imported += len(papers_info)
+            with self._conn:
+                self._conn.execute("INSERT INTO meta(key, value) VALUES ('json_migrated', '1')")
+            return imported
+
+
+class TopicJournal:
+    """Incremental, crash-safe writer for the per-topic papers_info.json files.
+
+    New papers are appended to `papers_info.journal.jsonl` next to the json file, so adding
+    N papers costs O(N) no matter how big the topic is. A background timer later folds the
+    journal into papers_info.json through a temp file + rename, so the json file is always
+    either the old or the new version and never half written. Writers to the same topic are
+    serialized with a thread lock plus, where the OS has it, a file lock shared across processes.
+    """
+
+    JSON_NAME = "papers_info.json"
+    JOURNAL_NAME = "papers_info.journal.jsonl"
+    LOCK_NAME = ".papers_info.lock"
+
+    def __init__(self, compact_delay: float = 2.0):
+        self.compact_delay = compact_delay  # seconds of quiet before a topic gets compacted
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._timers: Dict[str, threading.Timer] = {}
+
+    @contextmanager
+    def locked(self, topic_dir: str):
+        """Hold the write lock of one topic directory."""
+        with self._locks_guard:
+            lock = self._locks.setdefault(topic_dir, threading.Lock())
+        with lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(topic_dir, self.LOCK_NAME), "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def append(self, topic_dir: str, papers: Dict[str, Dict]) -> None:
+        """Journal `papers` (paper ID -> info) for a topic and schedule a compaction."""
+        if not papers:
+            return
+        os.makedirs(topic_dir, exist_ok=True)
+        lines = "".join(json.dumps({"id": paper_id, "info": info}) + "\n" for paper_id, info in papers.items())
+        with self.locked(topic_dir):
+            with open(os.path.join(topic_dir, self.JOURNAL_NAME), "a+b") as journal:
+                # a crash mid-append can leave a torn last line, start on a fresh one after it
+                if journal.tell() > 0:
+                    journal.seek(-1, os.SEEK_END)
+                    if journal.read(1) != b"\n":
+                        lines = "\n" + lines
+                journal.write(lines.encode("utf-8"))
+                journal.flush()
+                os.fsync(journal.fileno())
+        self._schedule(topic_dir)
+
+    def read(self, topic_dir: str) -> Dict[str, Dict]:
+        """The current papers of a topic: the json file with the journal replayed on top."""
+        papers_info = {}
+        try:
+            with open(os.path.join(topic_dir, self.JSON_NAME), "r") as json_file:
+                papers_info = json.load(json_file)
+        except FileNotFoundError:
+            pass
+        try:
+            with open(os.path.join(topic_dir, self.JOURNAL_NAME), "r") as journal:
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a line torn by a crash mid-append, every other line is intact
+                        continue
+                    papers_info[entry["id"]] = entry["info"]
+        except FileNotFoundError:
+            pass
+        return papers_info
+
+    def compact(self, topic_dir: str) -> None:
+        """Fold the journal into papers_info.json atomically and start a fresh journal."""
+        with self.locked(topic_dir):
+            journal_path = os.path.join(topic_dir, self.JOURNAL_NAME)
+            if not os.path.exists(journal_path):
+                return
+            try:
+                papers_info = self.read(topic_dir)
+            except json.JSONDecodeError as e:
+                # keep the journal so nothing is lost, someone has to look at the json file
+                print(f"Not compacting {topic_dir}, papers_info.json is unreadable: {str(e)}", file=sys.stderr)
+                return
+            fd, tmp_path = tempfile.mkstemp(dir=topic_dir, prefix=".papers_info.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as tmp_file:
+                    json.dump(papers_info, tmp_file, indent=2)
+                    tmp_file.flush()
+                    os.fsync(tmp_file.fileno())
+                os.replace(tmp_path, os.path.join(topic_dir, self.JSON_NAME))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            # a crash before this line only means the journal gets replayed again, which is harmless
+            os.unlink(journal_path)
+
+    def flush(self) -> None:
+        """Compact every topic that still has a compaction pending, right now."""
+        with self._locks_guard:
+            pending = list(self._timers.items())
+            self._timers.clear()
+        for topic_dir, timer in pending:
+            timer.cancel()
+            self.compact(topic_dir)
+
+    def _schedule(self, topic_dir: str) -> None:
+        # debounced, a burst of appends to one topic ends in a single compaction
+        with self._locks_guard:
+            previous = self._timers.get(topic_dir)
+            if previous:
+                previous.cancel()
+            timer = threading.Timer(self.compact_delay, self._run_compaction, args=(topic_dir,))
+            timer.daemon = True
+            self._timers[topic_dir] = timer
+            timer.start()
+
+    def _run_compaction(self, topic_dir: str) -> None:
+        with self._locks_guard:
+            self._timers.pop(topic_dir, None)
+        try:
+            self.compact(topic_dir)
+        except Exception as e:
+            print(f"Error compacting {topic_dir}: {str(e)}", file=sys.stderr)
@@ -0,0 +1,94 @@
+"""Stale-while-revalidate cache for the resources and prompts behind the chat commands.
+
+`@folders`, `@<topic>` and `/prompt` are answered from here when possible. An entry older
+than `fresh_seconds` is still served as is, and fetched again in the background for next
+time. The chatbot also fills the cache ahead of time: after a server connects, and after a
+tool that writes has made some of its entries out of date.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, List, Set, Tuple
+
+Fetch = Callable[[], Awaitable]
+
+
+class PrefetchCache:
+    def __init__(self, fresh_seconds: float = 30.0, max_entries: int = 128):
+        self.fresh_seconds = fresh_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, object]]" = OrderedDict()
+        self._fetches: Dict[Hashable, asyncio.Task] = {}  # fetches in flight, so each key is fetched once at a time
+        self._tasks: Set[asyncio.Task] = set()  # every fetch in flight, invalidated ones too, settled by close()
+        self.closed = False
+        self.counters = {"hits": 0, "stale_hits": 0, "misses": 0, "fetches": 0, "errors": 0}
+
+    async def get(self, key: Hashable, fetch: Fetch):
+        """The value of `key`: from the cache if there, else fetched now. Stale values are refreshed behind the scenes."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.counters["misses"] += 1
+            # shielded, a caller that gives up doesn't cancel the fetch for everyone else
+            return await asyncio.shield(self.refresh(key, fetch))
+        self._entries.move_to_end(key)
+        if time.monotonic() - entry[0] < self.fresh_seconds:
+            self.counters["hits"] += 1
+        else:
+            self.counters["stale_hits"] += 1
+            self.refresh(key, fetch)
+        return entry[1]
+
+    def refresh(self, key: Hashable, fetch: Fetch) -> asyncio.Task:
+        """Fetch `key` in the background, or join the fetch already running for it."""
+        task = self._fetches.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key, fetch))
+            self._fetches[key] = task
+            self._tasks.add(task)
+            task.add_done_callback(lambda done: self._fetched(key, done))
+        return task
+
+    async def _fetch(self, key: Hashable, fetch: Fetch):
+        self.counters["fetches"] += 1
+        value = await fetch()
+        # a fetch that started before its key was invalidated may have read old data, don't keep it
+        if value is not None and self._fetches.get(key) is asyncio.current_task():
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def _fetched(self, key: Hashable, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if self._fetches.get(key) is task:
+            del self._fetches[key]
+        # a failed background refresh keeps the old value, the next read tries again
+        if not task.cancelled() and task.exception() is not None:
+            self.counters["errors"] += 1
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> List[Hashable]:
+        """Drop the entries whose key matches, returns their keys, most recently used first."""
+        dropped = [key for key in self._entries if predicate(key)]
+        for key in dropped:
+            del self._entries[key]
+        for key in [key for key in self._fetches if predicate(key)]:
+            del self._fetches[key]
+        return dropped[::-1]
+
+    def recent(self, predicate: Callable[[Hashable], bool], limit: int) -> List[Hashable]:
+        """Up to `limit` cached keys that match, most recently used first."""
+        return [key for key in reversed(self._entries) if predicate(key)][:limit]
+
+    async def close(self, timeout: float = 5.0) -> None:
+        """Let the fetches in flight finish, cancelling whatever is left after `timeout` seconds."""
+        self.closed = True
+        deadline = time.monotonic() + timeout
+        # fetches started while waiting are waited for too
+        while self._tasks:
+            _, pending = await asyncio.wait(set(self._tasks), timeout=max(0.0, deadline - time.monotonic()))
+            if pending:
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                return
@@ -1,10 +1,98 @@
-from mcp.server.fastmcp import FastMCP
-import arxiv
-from typing import List
+from mcp.server.fastmcp import Context, FastMCP
+from typing import Dict, List
 import os
 import json 
+import sys
+import atexit
+import threading
+import anyio
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from pydantic import AnyUrl
+from arxiv_cache import ArxivBackend, FakeArxivBackend, SearchCache
+from paper_store import PaperStore, TopicJournal
 
-PAPERS_DIR = os.path.join(os.path.dirname(__file__), "papers")
+PAPERS_DIR = os.getenv("RESEARCH_PAPERS_DIR") or os.path.join(os.path.dirname(__file__), "papers")
+DB_PATH = os.path.join(PAPERS_DIR, "papers.db")
+# papers://{topic} is served in pages of this many papers unless the uri asks for another size
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# repeated searches are served from cache for this long, set ARXIV_CACHE_DISK=0 to keep the cache in memory only
+SEARCH_CACHE_TTL = float(os.getenv("ARXIV_CACHE_TTL", "3600"))
+SEARCH_CACHE_DISK = os.getenv("ARXIV_CACHE_DISK", "1") != "0"
+# ARXIV_BACKEND=fake:<corpus size> swaps arXiv for a local, deterministic fake (offline work, benchmarks)
+ARXIV_BACKEND = os.getenv("ARXIV_BACKEND", "arxiv")
+# topics ingest_topics searches at once; requests to arXiv itself still go one at a time (see ArxivBackend)
+INGEST_WORKERS = 4
+
+_store = None
+_search_cache = None
+# the slow tools run in worker threads, so the store and the cache can be asked for from several at once
+_init_lock = threading.Lock()
+_journal = TopicJournal()
+# fold whatever is still only in the journals into the json files on the way out
+atexit.register(_journal.flush)
+
+
+def get_store() -> PaperStore:
+    """Open the paper store on first use, importing any papers_info.json files from older versions."""
+    global _store
+    with _init_lock:
+        if _store is None:
+            os.makedirs(PAPERS_DIR, exist_ok=True)
+            store = PaperStore(DB_PATH)
+            imported = store.migrate_json_dir(PAPERS_DIR)
+            if imported:
+                print(f"Imported {imported} papers from papers_info.json files into {DB_PATH}", file=sys.stderr)
+            _store = store
+    return _store
+
+
+def get_search_cache() -> SearchCache:
+    """The arXiv search cache, shared by every tool call of this server."""
+    global _search_cache
+    with _init_lock:
+        if _search_cache is None:
+            disk_path = None
+            if SEARCH_CACHE_DISK:
+                os.makedirs(PAPERS_DIR, exist_ok=True)
+                disk_path = os.path.join(PAPERS_DIR, "search_cache.db")
+            if ARXIV_BACKEND.startswith("fake"):
+                _, _, corpus_size = ARXIV_BACKEND.partition(":")
+                backend = FakeArxivBackend(int(corpus_size or 1000))
+            else:
+                backend = ArxivBackend()
+            _search_cache = SearchCache(backend, ttl=SEARCH_CACHE_TTL, disk_path=disk_path)
+    return _search_cache
+
+
+def topic_key(topic: str) -> str:
+    """Normalize a topic the same way its folder name has always been built."""
+    return topic.lower().replace(" ", "_")
+
+
+def topic_uri(topic: str) -> str:
+    """The resource a topic's papers are read through."""
+    return f"papers://{topic_key(topic)}"
+
+
+async def announce_topics(ctx: Context, topics: List[str]) -> None:
+    """Tell the client which resources a write changed, so it doesn't have to guess what to refresh."""
+    for uri in ["papers://folders", *dict.fromkeys(topic_uri(topic) for topic in topics)]:
+        await ctx.session.send_resource_updated(AnyUrl(uri))
+
+
+def save_topic_papers(topic: str, papers: Dict[str, Dict]) -> str:
+    """File search results under `topic`, returns the topic's directory."""
+    path = os.path.join(PAPERS_DIR, topic_key(topic))
+
+    # the store is what lookups go through ...
+    added = get_store().add_papers(topic_key(topic), papers)
+
+    # ... and the json file stays around as a readable copy of the topic,
+    # new papers are only appended to its journal and folded in later in the background
+    _journal.append(path, {paper_id: papers[paper_id] for paper_id in added})
+    return path
 
 # Initialize the MCP server with explicit configuration
 mcp = FastMCP(
@@ -17,7 +105,7 @@ mcp = FastMCP(
 #let's now define our tools 
 #it's as easy as using the @mcp.tool decorator
 @mcp.tool()
-def get_arxiv_papers(topic: str, max_results: int = 2) -> List[str]:
+async def get_arxiv_papers(topic: str, ctx: Context, max_results: int = 2) -> List[str]:
     """
     Search for papers on arXiv based on a given topic.
     
@@ -28,50 +116,21 @@ def get_arxiv_papers(topic: str, max_results: int = 2) -> List[str]:
     Returns:
         List of paper objects
     """
-    
-    # Use arxiv to find the papers 
-    client = arxiv.Client()
+    # sync tools run on the server's event loop, this one would keep it from answering anything
+    # else (pings included) for as long as arXiv takes
+    paper_ids = await anyio.to_thread.run_sync(_get_arxiv_papers, topic, max_results)
+    await announce_topics(ctx, [topic])
+    return paper_ids
 
-    # Search for the most relevant articles matching the queried topic
-    search = arxiv.Search(
-        query = topic,
-        max_results = max_results,
-        sort_by = arxiv.SortCriterion.Relevance
-    )
 
-    papers = client.results(search)
-    
-    # Create directory for this topic
-    path = os.path.join(PAPERS_DIR, topic.lower().replace(" ", "_"))
-    os.makedirs(path, exist_ok=True)
-    
-    file_path = os.path.join(path, "papers_info.json")
+def _get_arxiv_papers(topic: str, max_results: int) -> List[str]:
+    # Use arxiv to find the papers, repeated searches come straight from the cache
+    new_papers = get_search_cache().search(topic, max_results)
+    paper_ids = list(new_papers)
 
-    # Try to load existing papers info
-    try:
-        with open(file_path, "r") as json_file:
-            papers_info = json.load(json_file)
-    except (FileNotFoundError, json.JSONDecodeError):
-        papers_info = {}
-
-    # Process each paper and add to papers_info  
-    paper_ids = []
-    for paper in papers:
-        paper_ids.append(paper.get_short_id())
-        paper_info = {
-            'title': paper.title,
-            'authors': [author.name for author in paper.authors],
-            'summary': paper.summary,
-            'pdf_url': paper.pdf_url,
-            'published': str(paper.published.date())
-        }
-        papers_info[paper.get_short_id()] = paper_info
-    
-    # Save updated papers_info to json file
-    with open(file_path, "w") as json_file:
-        json.dump(papers_info, json_file, indent=2)
+    path = save_topic_papers(topic, new_papers)
     
-    print(f"Results are saved in: {file_path}")
+    print(f"Results are saved in: {path}", file=sys.stderr)
     
     return paper_ids
 
@@ -87,24 +146,105 @@ def extract_info(paper_id: str) -> str:
     Returns:
         JSON string with paper information if found, error message if not found
     """
-    if not os.path.exists(PAPERS_DIR):
-        return f"Papers directory '{PAPERS_DIR}' does not exist. Please run a search first."
- 
-    for item in os.listdir(PAPERS_DIR):
-        item_path = os.path.join(PAPERS_DIR, item)
-        if os.path.isdir(item_path):
-            file_path = os.path.join(item_path, "papers_info.json")
-            if os.path.isfile(file_path):
-                try:
-                    with open(file_path, "r") as json_file:
-                        papers_info = json.load(json_file)
-                        if paper_id in papers_info:
-                            return json.dumps(papers_info[paper_id], indent=2)
-                except (FileNotFoundError, json.JSONDecodeError) as e:
-                    print(f"Error reading {file_path}: {str(e)}")
-                    continue
+    paper_info = get_store().get_paper(paper_id)
+    if paper_info:
+        return json.dumps(paper_info, indent=2)
     return f"There's no saved information related to paper {paper_id}."
 
+@mcp.tool()
+def extract_info_many(paper_ids: List[str]) -> str:
+    """
+    Look up several papers at once, for example every ID get_arxiv_papers or ingest_topics returned.
+    Prefer this over calling extract_info once per paper.
+    
+    Args:
+        paper_ids: The IDs of the papers to look for
+        
+    Returns:
+        JSON object with the information of every paper found, by ID, and the IDs that weren't found
+    """
+    paper_ids = list(dict.fromkeys(paper_ids))
+    papers = get_store().get_papers(paper_ids)
+    return json.dumps({
+        "papers": {paper_id: papers[paper_id] for paper_id in paper_ids if paper_id in papers},
+        "not_found": [paper_id for paper_id in paper_ids if paper_id not in papers],
+    }, indent=2)
+
+
+@mcp.tool()
+async def ingest_topics(topics: List[str], ctx: Context, max_results: int = 2) -> str:
+    """
+    Search arXiv for several topics at once and save the papers found, like one get_arxiv_papers call per topic.
+    
+    Args:
+        topics: The topics to search for
+        max_results: The maximum number of papers to fetch per topic
+
+    Returns:
+        JSON object with the paper IDs found per topic and the list of distinct paper IDs across all topics
+    """
+    # in a worker thread, like get_arxiv_papers, so the server stays responsive during the ingest
+    result = await anyio.to_thread.run_sync(_ingest_topics, topics, max_results)
+    await announce_topics(ctx, list(json.loads(result)["topics"]))
+    return result
+
+
+def _ingest_topics(topics: List[str], max_results: int) -> str:
+    # topics that end up in the same folder are searched once
+    by_key = {}
+    for topic in topics:
+        by_key.setdefault(topic_key(topic), topic)
+    unique_topics = list(by_key.values())
+    cache = get_search_cache()
+
+    def fetch(topic: str):
+        try:
+            return cache.search(topic, max_results)
+        except Exception as e:
+            return e
+
+    if not unique_topics:
+        return json.dumps({"topics": {}, "paper_ids": []})
+    with ThreadPoolExecutor(max_workers=min(INGEST_WORKERS, len(unique_topics))) as pool:
+        results = list(pool.map(fetch, unique_topics))
+
+    by_topic, errors, paper_ids = {}, {}, {}
+    for topic, papers in zip(unique_topics, results):
+        if isinstance(papers, Exception):
+            errors[topic] = str(papers)
+            continue
+        path = save_topic_papers(topic, papers)
+        print(f"Results are saved in: {path}", file=sys.stderr)
+        by_topic[topic] = list(papers)
+        # a paper found under several topics is filed under each of them but listed once
+        paper_ids.update(dict.fromkeys(papers))
+    result = {"topics": by_topic, "paper_ids": list(paper_ids)}
+    if errors:
+        result["errors"] = errors
+    return json.dumps(result, indent=2)
+
+
+@mcp.tool()
+def search_local_papers(query: str, max_results: int = 10) -> str:
+    """
+    Full-text search over the titles, authors and summaries of all papers saved so far.
+    Use this before going to arXiv again, it answers from the local library right away.
+    
+    Args:
+        query: Free-text search terms
+        max_results: The maximum number of papers to return
+
+    Returns:
+        JSON list of the best matching papers, best match first
+    """
+    results = get_store().search(query, max_results)
+    if not results:
+        return f"No saved papers match '{query}'."
+    return json.dumps([
+        {"paper_id": paper_id, "score": round(score, 3), **paper_info}
+        for paper_id, score, paper_info in results
+    ], indent=2)
+
 #resources are read-only data that applications can choose to use or we can give to a model 
 #let's now add resources to our server 
 @mcp.resource("papers://folders")
@@ -112,61 +252,104 @@ def get_available_folders() -> str:
     """
     List all available topic folders in the papers directory.
     """
-    folders = []
-    #let's now get all topic directories 
-    if os.path.exists(PAPERS_DIR):
-        for topic_dir in os.listdir(PAPERS_DIR):
-            topic_path = os.path.join(PAPERS_DIR, topic_dir)
-            if os.path.isdir(topic_path):
-                papers_file = os.path.join(topic_path, "papers_info.json")
-                if os.path.exists(papers_file):
-                    folders.append(topic_dir)
+    #let's now get all topics that have papers, the ones that got new papers last first
+    folders = get_store().list_topics(recent_first=True)
 
     #Let's create a simple markdown list
     content = "# Available Topics\n\n"
     if folders:
         for folder in folders:
-            content += f"- {folder}\n"
+            content += f"- {folder} ({topic_uri(folder)})\n"
         content += "\nUse @<topic> to access papers in this topic.\n"
     else:
         content += "No topics found.\n"
     return content
 
 
+def _page_args(topic: str):
+    """Split 'topic?page=N&size=M' into the topic and a valid page number and size."""
+    topic, _, query = topic.partition("?")
+    params = parse_qs(query)
+
+    def number(name: str, default: int, upper: int) -> int:
+        try:
+            return min(upper, max(1, int(params[name][0])))
+        except (KeyError, ValueError):
+            return default
+
+    return topic, number("page", 1, 1_000_000), number("size", PAGE_SIZE, MAX_PAGE_SIZE)
+
+
 @mcp.resource("papers://{topic}")
 def get_topic_papers(topic: str) -> str:
     """ 
-    Get detailed information about papers on a specific topic.
+    Get detailed information about papers on a specific topic, one page at a time.
     
     Required Arguments:
-        "topic": The research topic to retrieve papers for. 
+        "topic": The research topic to retrieve papers for, optionally followed by
+                 "?page=N&size=M" to pick a page (20 papers per page by default).
     """
-    topic_dir = topic.lower().replace(" ", "_")
-    papers_file = os.path.join(PAPERS_DIR, topic_dir, "papers_info.json")
+    topic, page, size = _page_args(topic)
+    key = topic_key(topic)
+    store = get_store()
+    total = store.count_topic_papers(key)
     
-    if not os.path.exists(papers_file):
+    if not total:
         return f"# No papers found for topic: {topic}\n\nPlease try searching for papers on this topic first."
     
-    try:
-        with open(papers_file, 'r') as f:
-            papers_data = json.load(f)
-        
-        # let's now create a markdown content with paper details to return 
-        content = f"# Papers on {topic.replace('_', ' ').title()}\n\n"
-        content += f"Total papers: {len(papers_data)}\n\n"
-        
-        for paper_id, paper_info in papers_data.items():
-            content += f"## {paper_info['title']}\n"
-            content += f"- **Paper ID**: {paper_id}\n"
-            content += f"- **Authors**: {', '.join(paper_info['authors'])}\n"
-            content += f"- **Published**: {paper_info['published']}\n"
-            content += f"- **PDF URL**: [{paper_info['pdf_url']}]({paper_info['pdf_url']})\n\n"
-            content += f"### Summary\n{paper_info['summary'][:500]}...\n\n"
-            content += "---\n\n"
-        
-        return content
-    except json.JSONDecodeError:
-        return f"# Error reading papers data for {topic}\n\nThe papers data file is corrupted."
+    pages = -(-total // size)
+    papers_data = store.get_topic_papers(key, offset=(page - 1) * size, limit=size)
+
+    # let's now create a markdown content with paper details to return,
+    # collected as parts and joined once instead of growing one string
+    parts = [
+        f"# Papers on {topic.replace('_', ' ').title()}\n\n",
+        f"Total papers: {total} (page {page} of {pages})\n\n",
+    ]
+    for paper_id, paper_info in papers_data.items():
+        parts += [
+            f"## {paper_info['title']}\n",
+            f"- **Paper ID**: {paper_id}\n",
+            f"- **Authors**: {', '.join(paper_info['authors'])}\n",
+            f"- **Published**: {paper_info['published']}\n",
+            f"- **PDF URL**: [{paper_info['pdf_url']}]({paper_info['pdf_url']})\n\n",
+            f"### Summary\n{paper_info['summary'][:500]}...\n\n",
+            "---\n\n",
+        ]
+    if page < pages:
+        parts.append(f"Next page: papers://{topic}?page={page + 1}&size={size}\n")
+    
+    return "".join(parts)
+
+
+@mcp.resource("papers://search/{query}")
+def get_search_results(query: str) -> str:
+    """
+    Saved papers ranked by how well they match a free-text query.
+    """
+    results = get_store().search(query.replace("_", " "), 10)
+    content = f"# Saved papers matching '{query}'\n\n"
+    if not results:
+        return content + "No matching papers found.\n"
+    for paper_id, score, paper_info in results:
+        content += f"## {paper_info['title']}\n"
+        content += f"- **Paper ID**: {paper_id}\n"
+        content += f"- **Authors**: {', '.join(paper_info['authors'])}\n"
+        content += f"- **Published**: {paper_info['published']}\n"
+        content += f"- **Score**: {score:.3f}\n\n"
+    return content
+
+
+@mcp.resource("papers://cache/stats")
+def get_search_cache_stats() -> str:
+    """
+    Hit, miss and eviction counters of the arXiv search cache.
+    """
+    stats = get_search_cache().stats()
+    content = "# arXiv Search Cache\n\n"
+    for name, value in stats.items():
+        content += f"- **{name.replace('_', ' ').title()}**: {value}\n"
+    return content
 
 # "prompt" is meant to be user controlled, and the server can also provide a "prompt template" to the client 
 # so that the user can use the template and not have todo the whole prompt engineering themselves, 
@@ -183,7 +366,7 @@ def generate_search_prompt(topic: str, num_papers: int = 5) -> str:
 
     Follow these steps: 
     1. First, search for the papers using get_arxiv_papers(topic='{topic}', max_results={num_papers})
-    2. For each paper found, extract and organize the following information using the extract_info tool:
+    2. Look up all of the papers found in one call with extract_info_many(paper_ids=[...]), then extract and organize the following information for each of them:
    - Paper title
    - Authors
    - Publication date
@@ -0,0 +1,103 @@
+"""BM25 full-text index over the papers in the paper store.
+
+The inverted index lives in the same SQLite database as the papers (term -> paper postings
+plus per-paper lengths), so it's updated in the same transaction that saves a paper and
+a query only touches the postings of its own terms.
+"""
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS index_postings (
+    term TEXT NOT NULL,
+    paper_id TEXT NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, paper_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS index_docs (
+    paper_id TEXT PRIMARY KEY,
+    length INTEGER NOT NULL
+);
+"""
+
+# the usual BM25 knobs
+K1 = 1.2
+B = 0.75
+TITLE_WEIGHT = 2  # title terms count this many times, a match there says more than one in the summary
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in into is it its of on or that the their this to was "
+    "we were which with our these those than then there via can not but also such using based".split()
+)
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric terms, without stopwords and single characters."""
+    return [token for token in _TOKEN.findall(text.lower()) if len(token) > 1 and token not in STOPWORDS]
+
+
+def paper_terms(info: Dict) -> Counter:
+    """Term frequencies of a paper's title, authors and summary."""
+    terms = Counter()
+    for _ in range(TITLE_WEIGHT):
+        terms.update(tokenize(info.get("title") or ""))
+    terms.update(tokenize(" ".join(info.get("authors") or [])))
+    terms.update(tokenize(info.get("summary") or ""))
+    return terms
+
+
+def bm25_idf(docs: int, df: int) -> float:
+    """Inverse document frequency of a term found in `df` of `docs` documents."""
+    return math.log(1 + (docs - df + 0.5) / (df + 0.5))
+
+
+def bm25_term_score(tf: int, length: int, avg_length: float, idf: float) -> float:
+    """BM25 contribution of one term to one document."""
+    return idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_length))
+
+
+def create(conn) -> None:
+    conn.executescript(SCHEMA)
+
+
+def index_paper(conn, paper_id: str, info: Dict) -> None:
+    """(Re)index one paper, inside the caller's transaction."""
+    terms = paper_terms(info)
+    conn.execute("DELETE FROM index_postings WHERE paper_id = ?", (paper_id,))
+    conn.executemany(
+        "INSERT INTO index_postings(term, paper_id, tf) VALUES (?, ?, ?)",
+        [(term, paper_id, tf) for term, tf in terms.items()],
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO index_docs(paper_id, length) VALUES (?, ?)",
+        (paper_id, sum(terms.values())),
+    )
+
+
+def search(conn, query: str, limit: int = 10) -> List[Tuple[str, float]]:
+    """The `limit` best matching paper IDs for `query`, with their BM25 scores."""
+    terms = set(tokenize(query))
+    if not terms:
+        return []
+    docs, total_length = conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM index_docs").fetchone()
+    if not docs:
+        return []
+    avg_length = total_length / docs or 1.0
+
+    scores: Dict[str, float] = {}
+    for term in terms:
+        postings = conn.execute(
+            "SELECT p.paper_id, p.tf, d.length FROM index_postings p JOIN index_docs d ON d.paper_id = p.paper_id "
+            "WHERE p.term = ?",
+            (term,),
+        ).fetchall()
+        if not postings:
+            continue
+        idf = bm25_idf(docs, len(postings))
+        for paper_id, tf, length in postings:
+            scores[paper_id] = scores.get(paper_id, 0.0) + bm25_term_score(tf, length, avg_length, idf)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
@@ -0,0 +1,121 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from arxiv_cache import FakeArxivBackend, SearchCache
+
+
+class GatedBackend(FakeArxivBackend):
+    """FakeArxivBackend whose searches wait for `release`, so followers can pile up behind a leader."""
+
+    def __init__(self, fail: bool = False):
+        super().__init__(corpus_size=100)
+        self.release = threading.Event()
+        self.fail = fail
+
+    def search(self, query, max_results):
+        self.release.wait(5)
+        if self.fail:
+            raise ConnectionError("arXiv is down")
+        return super().search(query, max_results)
+
+
+def run_concurrently(cache, count):
+    """Start `count` identical searches, returns their threads and a list collecting results or errors."""
+    results = []
+
+    def search():
+        try:
+            results.append(cache.search("graph theory", 3))
+        except Exception as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=search) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def wait_for_followers(cache, count):
+    deadline = time.time() + 5
+    while cache.stats()["coalesced"] < count and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_identical_searches_share_one_request():
+    backend = GatedBackend()
+    cache = SearchCache(backend)
+    threads, results = run_concurrently(cache, 4)
+    wait_for_followers(cache, 3)
+    backend.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert backend.searches == 1
+    assert len(results) == 4 and all(result == results[0] for result in results)
+    assert cache.stats()["coalesced"] == 3
+
+
+def test_leader_failure_reaches_followers_and_next_search_retries():
+    backend = GatedBackend(fail=True)
+    cache = SearchCache(backend)
+    threads, results = run_concurrently(cache, 3)
+    wait_for_followers(cache, 2)
+    backend.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(results) == 3 and all(isinstance(result, ConnectionError) for result in results)
+    assert not cache._inflight
+
+    backend.fail = False
+    assert len(cache.search("graph theory", 3)) == 3
+
+
+def test_disk_save_failure_does_not_orphan_the_search(tmp_path, monkeypatch):
+    backend = GatedBackend()
+    cache = SearchCache(backend, ttl=0.2, disk_path=str(tmp_path / "search_cache.db"))
+
+    def locked(key, papers):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(cache, "_save_to_disk", locked)
+    threads, results = run_concurrently(cache, 3)
+    wait_for_followers(cache, 2)
+    backend.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(results) == 3 and all(len(result) == 3 for result in results)
+    assert not cache._inflight
+
+    # once the memory entry expires, the search goes to the backend again instead of hanging
+    time.sleep(0.3)
+    assert len(cache.search("graph theory", 3)) == 3
+    assert backend.searches == 2
+
+
+def test_expired_entries_are_fetched_again(tmp_path):
+    backend = FakeArxivBackend(corpus_size=100)
+    cache = SearchCache(backend, ttl=0.2, disk_path=str(tmp_path / "search_cache.db"))
+    cache.search("Graph  Theory", 3)
+    cache.search("graph theory", 3)
+    assert backend.searches == 1 and cache.stats()["hits"] == 1
+
+    time.sleep(0.3)
+    cache.search("graph theory", 3)
+    assert backend.searches == 2
+    assert cache.stats()["expired"] == 1
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    path = str(tmp_path / "search_cache.db")
+    backend = FakeArxivBackend(corpus_size=100)
+    papers = SearchCache(backend, disk_path=path).search("cryptography", 2)
+    assert SearchCache(backend, disk_path=path).search("cryptography", 2) == papers
+    assert backend.searches == 1
+
+
+@pytest.mark.parametrize("max_results", [1, 5])
+def test_max_results_is_part_of_the_key(max_results):
+    cache = SearchCache(FakeArxivBackend(corpus_size=100))
+    assert len(cache.search("quantum computing", max_results)) == max_results
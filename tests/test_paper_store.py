@@ -0,0 +1,81 @@
+import json
+import os
+
+from arxiv_cache import FakeArxivBackend
+from paper_store import PaperStore, TopicJournal
+
+
+def papers(start, count):
+    backend = FakeArxivBackend()
+    return dict(backend.paper(index) for index in range(start, start + count))
+
+
+def test_journal_is_read_on_top_of_the_json_file(tmp_path):
+    topic_dir = str(tmp_path / "graph_theory")
+    journal = TopicJournal(compact_delay=60)
+    journal.append(topic_dir, papers(0, 3))
+    journal.compact(topic_dir)
+    journal.append(topic_dir, papers(3, 2))
+    assert os.path.exists(os.path.join(topic_dir, TopicJournal.JOURNAL_NAME))
+    assert journal.read(topic_dir) == papers(0, 5)
+    journal.flush()
+
+
+def test_compaction_folds_the_journal_into_json(tmp_path):
+    topic_dir = str(tmp_path / "graph_theory")
+    journal = TopicJournal(compact_delay=60)
+    journal.append(topic_dir, papers(0, 2))
+    journal.append(topic_dir, papers(2, 2))
+    journal.flush()
+    assert not os.path.exists(os.path.join(topic_dir, TopicJournal.JOURNAL_NAME))
+    with open(os.path.join(topic_dir, TopicJournal.JSON_NAME)) as json_file:
+        assert json.load(json_file) == papers(0, 4)
+
+
+def test_torn_journal_line_is_skipped_and_appends_start_fresh(tmp_path):
+    topic_dir = str(tmp_path / "graph_theory")
+    journal = TopicJournal(compact_delay=60)
+    journal.append(topic_dir, papers(0, 2))
+    # a crash mid-append: half a line, no newline
+    with open(os.path.join(topic_dir, TopicJournal.JOURNAL_NAME), "a") as journal_file:
+        journal_file.write('{"id": "2000.00002v1", "info": {"ti')
+    assert journal.read(topic_dir) == papers(0, 2)
+
+    journal.append(topic_dir, papers(2, 1))
+    assert journal.read(topic_dir) == papers(0, 3)
+    journal.flush()
+    with open(os.path.join(topic_dir, TopicJournal.JSON_NAME)) as json_file:
+        assert json.load(json_file) == papers(0, 3)
+
+
+def test_unreadable_json_keeps_the_journal(tmp_path):
+    topic_dir = str(tmp_path / "graph_theory")
+    journal = TopicJournal(compact_delay=60)
+    journal.append(topic_dir, papers(0, 1))
+    with open(os.path.join(topic_dir, TopicJournal.JSON_NAME), "w") as json_file:
+        json_file.write("{not json")
+    journal.flush()
+    assert os.path.exists(os.path.join(topic_dir, TopicJournal.JOURNAL_NAME))
+
+
+def test_a_burst_of_appends_compacts_once_after_the_delay(tmp_path):
+    topic_dir = str(tmp_path / "graph_theory")
+    journal = TopicJournal(compact_delay=0.1)
+    for start in range(0, 6, 2):
+        journal.append(topic_dir, papers(start, 2))
+    assert len(journal._timers) == 1
+    journal._timers[topic_dir].join(5)
+    assert not os.path.exists(os.path.join(topic_dir, TopicJournal.JOURNAL_NAME))
+    assert journal.read(topic_dir) == papers(0, 6)
+
+
+def test_topics_can_be_listed_latest_first(tmp_path):
+    store = PaperStore(str(tmp_path / "papers.db"))
+    store.add_papers("graph_theory", papers(0, 2))
+    store.add_papers("cryptography", papers(2, 2))
+    store.add_papers("graph_theory", papers(4, 1))
+    # papers already filed under a topic don't make it recent again
+    store.add_papers("cryptography", papers(2, 1))
+    assert store.list_topics() == ["cryptography", "graph_theory"]
+    assert store.list_topics(recent_first=True) == ["graph_theory", "cryptography"]
+    store.close()
@@ -0,0 +1,105 @@
+import asyncio
+
+from prefetch_cache import PrefetchCache
+
+
+class Source:
+    """Fetches that return a new version each time and can be held back with `gate`."""
+
+    def __init__(self):
+        self.version = 0
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def fetch(self):
+        self.version += 1
+        version = self.version
+        await self.gate.wait()
+        return f"v{version}"
+
+
+def test_miss_then_hit_then_stale_hit_refreshes():
+    async def main():
+        source = Source()
+        cache = PrefetchCache(fresh_seconds=0.1)
+        assert await cache.get("folders", source.fetch) == "v1"
+        assert await cache.get("folders", source.fetch) == "v1"
+        await asyncio.sleep(0.15)
+        # stale, served as is and refreshed behind the scenes
+        assert await cache.get("folders", source.fetch) == "v1"
+        await cache.close()
+        assert await cache.get("folders", source.fetch) == "v2"
+        assert cache.counters == {"hits": 2, "stale_hits": 1, "misses": 1, "fetches": 2, "errors": 0}
+
+    asyncio.run(main())
+
+
+def test_concurrent_misses_share_one_fetch():
+    async def main():
+        source = Source()
+        cache = PrefetchCache()
+        values = await asyncio.gather(*(cache.get("folders", source.fetch) for _ in range(5)))
+        assert values == ["v1"] * 5 and source.version == 1
+
+    asyncio.run(main())
+
+
+def test_fetch_running_when_invalidated_is_not_stored():
+    async def main():
+        source = Source()
+        cache = PrefetchCache()
+        source.gate.clear()
+        old = cache.refresh("folders", source.fetch)
+        await asyncio.sleep(0)
+        assert cache.invalidate(lambda key: key == "folders") == []
+        new = cache.refresh("folders", source.fetch)
+        assert new is not old
+        source.gate.set()
+        await asyncio.gather(old, new)
+        # the fetch that started before the write may have read old data, only the new one is kept
+        assert await cache.get("folders", source.fetch) == "v2"
+
+    asyncio.run(main())
+
+
+def test_invalidate_returns_most_recently_used_first():
+    async def main():
+        source = Source()
+        cache = PrefetchCache()
+        for key in ("a", "b", "c"):
+            await cache.get(key, source.fetch)
+        await cache.get("a", source.fetch)
+        assert cache.recent(lambda key: True, 2) == ["a", "c"]
+        assert cache.invalidate(lambda key: key != "b") == ["a", "c"]
+        assert cache.recent(lambda key: True, 5) == ["b"]
+
+    asyncio.run(main())
+
+
+def test_close_settles_invalidated_fetches_too():
+    async def main():
+        cache = PrefetchCache()
+        slow = cache.refresh("folders", lambda: asyncio.sleep(10, "slow"))
+        cache.invalidate(lambda key: True)
+        quick = cache.refresh("folders", lambda: asyncio.sleep(0.01, "quick"))
+        await cache.close(timeout=0.2)
+        assert slow.cancelled() and quick.result() == "quick"
+        assert cache.closed and not cache._tasks
+
+    asyncio.run(main())
+
+
+def test_failed_refresh_keeps_the_old_value():
+    async def main():
+        cache = PrefetchCache(fresh_seconds=0)
+
+        async def broken():
+            raise ConnectionError("server went away")
+
+        assert await cache.get("folders", lambda: asyncio.sleep(0, "v1")) == "v1"
+        assert await cache.get("folders", broken) == "v1"
+        await cache.close()
+        assert await cache.get("folders", broken) == "v1"
+        assert cache.counters["errors"] >= 1
+
+    asyncio.run(main())
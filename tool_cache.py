@@ -0,0 +1,97 @@
+"""Client-side cache for the results of read-only MCP tools.
+
+Models often call the same read-only tool with the same arguments several times in a session
+(looking a paper up again, fetching the same URL, rereading a file). Tools opt in with a TTL,
+results are keyed by (server, tool, canonical arguments) in a size-bounded LRU, and tools that
+write invalidate what their server has cached.
+"""
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+# tool name -> seconds a result stays fresh; tools not listed here are never cached
+DEFAULT_TTLS = {
+    # research server
+    "extract_info": 3600.0,
+    "extract_info_many": 3600.0,
+    "search_local_papers": 600.0,
+    # fetch server
+    "fetch": 300.0,
+    # filesystem server, short-lived because files can change behind our back
+    "read_file": 30.0,
+    "read_text_file": 30.0,
+    "read_multiple_files": 30.0,
+    "list_directory": 30.0,
+    "get_file_info": 30.0,
+}
+
+# tools that change what the cached tools of their own server would return
+DEFAULT_INVALIDATORS = {
+    "get_arxiv_papers",
+    "ingest_topics",
+    "write_file",
+    "edit_file",
+    "create_directory",
+    "move_file",
+}
+
+
+def canonical_arguments(arguments) -> str:
+    """The same arguments always serialize the same way, whatever order the model wrote them in."""
+    return json.dumps(arguments or {}, sort_keys=True, separators=(",", ":"), default=str)
+
+
+class ToolResultCache:
+    def __init__(self, ttls: Optional[Dict[str, float]] = None, invalidators=None, max_entries: int = 512):
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.invalidators = set(DEFAULT_INVALIDATORS if invalidators is None else invalidators)
+        self.server_ttls: Dict[str, Dict[str, float]] = {}  # per-server overrides from server_config.json
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, object]]" = OrderedDict()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def configure_server(self, server_name: str, ttls: Dict[str, float]) -> None:
+        """Override the TTLs of one server's tools; a TTL of 0 turns caching off for that tool."""
+        self.server_ttls[server_name] = dict(ttls)
+
+    def ttl(self, server_name: str, tool_name: str) -> float:
+        return self.server_ttls.get(server_name, {}).get(tool_name, self.ttls.get(tool_name, 0.0))
+
+    def get(self, server_name: str, tool_name: str, arguments):
+        """The cached result of this exact call, or None."""
+        ttl = self.ttl(server_name, tool_name)
+        if not ttl:
+            return None
+        key = (server_name, tool_name, canonical_arguments(arguments))
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] >= ttl:
+            if entry is not None:
+                del self._entries[key]
+            self.counters["misses"] += 1
+            return None
+        self._entries.move_to_end(key)
+        self.counters["hits"] += 1
+        return entry[1]
+
+    def put(self, server_name: str, tool_name: str, arguments, result) -> None:
+        if not self.ttl(server_name, tool_name):
+            return
+        key = (server_name, tool_name, canonical_arguments(arguments))
+        self._entries[key] = (time.monotonic(), result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def after_call(self, server_name: str, tool_name: str) -> None:
+        """Invalidation hook, run after every tool call."""
+        if tool_name in self.invalidators:
+            self.invalidate(server_name)
+
+    def invalidate(self, server_name: Optional[str] = None, tool_name: Optional[str] = None) -> None:
+        """Drop cached results, of one server and/or tool, or all of them."""
+        for key in [key for key in self._entries
+                    if (server_name is None or key[0] == server_name) and (tool_name is None or key[1] == tool_name)]:
+            del self._entries[key]
+            self.counters["invalidations"] += 1
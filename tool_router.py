@@ -0,0 +1,111 @@
+"""Picks the tools worth sending to the model for a query.
+
+Every connected server adds its tool schemas to every model request, and with a few servers
+they make up a large part of the input tokens. The router keeps a small BM25 index over each
+tool's name, description and input schema (same scoring as the paper search, see
+search_index) and offers the model the top_k tools for the query, plus pinned ones.
+"""
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+from search_index import bm25_idf, bm25_term_score, tokenize
+
+NAME_WEIGHT = 3  # name terms count this many times, "fetch" in the query is a strong hint for the fetch tool
+
+
+def _schema_text(schema) -> Iterator[str]:
+    """Property names, descriptions and enum values of a JSON schema, nested ones included."""
+    if isinstance(schema, dict):
+        for key, value in schema.items():
+            if key == "properties" and isinstance(value, dict):
+                yield from value.keys()
+            elif key in ("description", "title") and isinstance(value, str):
+                yield value
+            elif key == "enum" and isinstance(value, list):
+                yield from (str(item) for item in value)
+            yield from _schema_text(value)
+    elif isinstance(schema, list):
+        for item in schema:
+            yield from _schema_text(item)
+
+
+def tool_terms(tool: Dict) -> Counter:
+    """Term frequencies of a tool's name, description and input schema."""
+    terms = Counter()
+    for _ in range(NAME_WEIGHT):
+        terms.update(tokenize(tool["name"]))
+    terms.update(tokenize(tool.get("description") or ""))
+    terms.update(tokenize(" ".join(_schema_text(tool.get("input_schema") or {}))))
+    return terms
+
+
+class ToolRouter:
+    def __init__(self, top_k: int = 8):
+        self.top_k = top_k  # 0 offers every tool
+        self.pinned: Set[str] = set()  # offered whatever the query, "pinned_tools" in server_config.json
+        self._catalog = None
+        self._docs: Dict[str, Counter] = {}
+        self._lengths: Dict[str, int] = {}
+        self._df: Counter = Counter()
+        self._avg_length = 0.0
+
+    def _index(self, tools: List[Dict]) -> None:
+        """(Re)build the index when the catalog changed since the last query."""
+        catalog = [(tool["name"], tool.get("description")) for tool in tools]
+        if catalog == self._catalog:
+            return
+        self._catalog = catalog
+        self._docs = {tool["name"]: tool_terms(tool) for tool in tools}
+        self._lengths = {name: sum(terms.values()) for name, terms in self._docs.items()}
+        self._df = Counter(term for terms in self._docs.values() for term in terms)
+        self._avg_length = sum(self._lengths.values()) / max(1, len(self._docs))
+
+    def scores(self, tools: List[Dict], text: str) -> Dict[str, float]:
+        """BM25 score of every tool against `text`, tools sharing no term with it are left out."""
+        self._index(tools)
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(text)):
+            df = self._df.get(term)
+            if not df:
+                continue
+            idf = bm25_idf(len(self._docs), df)
+            for name, terms in self._docs.items():
+                if term in terms:
+                    score = bm25_term_score(terms[term], self._lengths[name], self._avg_length, idf)
+                    scores[name] = scores.get(name, 0.0) + score
+        return scores
+
+    def select(self, tools: List[Dict], text: str, keep: Iterable[str] = (),
+               servers: Optional[Dict[str, str]] = None) -> Optional[Set[str]]:
+        """Names of the tools to offer for `text`: top_k of them, pinned ones and `keep`.
+
+        The tools matching `text` best come first. When fewer than top_k match at all, the
+        rest is filled up with the other tools of the servers that matched (`servers` maps
+        tool names to their server), best matching server first, then with everyone else's:
+        a query about a file that only mentions "create" still needs read_file.
+        None means offer all of them, either because there are few enough anyway or because
+        nothing in `text` points to any tool in particular.
+        """
+        if not self.top_k or len(tools) <= self.top_k:
+            return None
+        scores = self.scores(tools, text)
+        if not scores:
+            return None
+        servers = servers or {}
+        server_scores: Dict[str, float] = {}
+        for name, score in scores.items():
+            server = servers.get(name, "")
+            server_scores[server] = max(server_scores.get(server, 0.0), score)
+        # ties are broken by server and catalog position, so the same text gets the same tools
+        # (and the same prompt-cache key) whichever server connected first
+        position: Dict[str, int] = {}
+        seen: Counter = Counter()
+        for tool in tools:
+            server = servers.get(tool["name"], "")
+            position[tool["name"]] = seen[server]
+            seen[server] += 1
+        ranked = sorted(position, key=lambda name: (
+            -scores.get(name, 0.0), -server_scores.get(servers.get(name, ""), 0.0),
+            servers.get(name, ""), position[name],
+        ))
+        return (set(ranked[:self.top_k]) | self.pinned | set(keep)) & set(position)